@@ -0,0 +1,99 @@
+import threading
+import time
+from metrics import ACCOUNT_CALLS_SAVED
+from logging_config import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class AccountConfigCache:
+    """
+    Per-symbol leverage and margin type of the futures account.
+
+    Loaded from one get_position_risk() call and reloaded every `ttl` seconds,
+    then updated after each successful change. Changes whose target state is
+    already cached are skipped, and `saved_calls` counts them. A failed load
+    is not retried before the TTL expires either, so a signal makes at most
+    one get_position_risk() call.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AccountConfigCache, cls).__new__(cls)
+            cls._instance.leverage = {}
+            cls._instance.margin_type = {}
+            cls._instance.loaded_at = None
+            cls._instance.attempted_at = None
+            cls._instance.saved_calls = 0
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def warm(self, client):
+        self.attempted_at = time.monotonic()
+        try:
+            positions = client.get_position_risk()
+        except Exception as e:
+            logger.error(f"Error loading leverage and margin types: {e}")
+            return False
+
+        leverage, margin_type = {}, {}
+        for position in positions:
+            leverage.setdefault(position['symbol'], int(position['leverage']))
+            margin_type.setdefault(position['symbol'], position['marginType'].upper())
+        with self.lock:
+            self.leverage, self.margin_type = leverage, margin_type
+            self.loaded_at = time.monotonic()
+        logger.info(f"Leverage and margin types loaded for {len(leverage)} symbols")
+        return True
+
+    def _is_stale(self):
+        return self.attempted_at is None or time.monotonic() - self.attempted_at > config.ACCOUNT_CONFIG_TTL
+
+    def _skip(self, call, symbol, cached, wanted):
+        with self.lock:
+            if cached != wanted:
+                return False
+            self.saved_calls += 1
+            saved_calls = self.saved_calls
+        ACCOUNT_CALLS_SAVED.inc(endpoint=call)
+        logger.info(f"Skipped {call} for {symbol}, already {wanted} ({saved_calls} account calls saved)")
+        return True
+
+    def ensure_leverage(self, client, symbol, leverage):
+        """
+        Set the leverage of a symbol unless it is already set.
+
+        :param symbol: The exchange symbol, e.g. 'BTCUSDT'.
+        :return: True if a change_leverage call was made.
+        """
+        if self._is_stale():
+            self.warm(client)
+        if self._skip('change_leverage', symbol, self.leverage.get(symbol), leverage):
+            return False
+
+        client.change_leverage(symbol=symbol, leverage=leverage)
+        self.leverage[symbol] = leverage
+        return True
+
+    def ensure_margin_type(self, client, symbol, margin_type):
+        """
+        Set the margin type of a symbol unless it is already set.
+
+        :param symbol: The exchange symbol, e.g. 'BTCUSDT'.
+        :return: True if a change_margin_type call was made.
+        """
+        if self._is_stale():
+            self.warm(client)
+        if self._skip('change_margin_type', symbol, self.margin_type.get(symbol), margin_type):
+            return False
+
+        try:
+            client.change_margin_type(symbol=symbol, marginType=margin_type)
+        except Exception as e:
+            if 'No need to change margin type.' not in str(e):
+                raise
+            logger.info(f"Margin type of {symbol} already set to {margin_type}.")
+        self.margin_type[symbol] = margin_type
+        return True
@@ -0,0 +1,114 @@
+import threading
+import time
+from metrics import stage_timer
+from logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AccountLedger:
+    """
+    In-process view of the USDT futures balance used for position sizing.
+
+    The wallet and available balances come from the exchange: seeded from
+    client.balance() by the polling loop. ACCOUNT_UPDATE events carry the new
+    wallet balance but not the available one, so they also mark the ledger
+    stale and the next signal refreshes it before sizing, which returns the
+    margin of closed positions. Binance already deducts the margin of open
+    orders, pending deferred entries included, from the available balance, so
+    the ledger only has to account for placements made since the last refresh:
+    each signal reserves its margin before placing and the reservation is
+    committed or released afterwards. Concurrent signals can therefore never
+    allocate more than is available.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AccountLedger, cls).__new__(cls)
+            cls._instance.asset = 'USDT'
+            cls._instance.wallet_balance = None
+            cls._instance.available_balance = None
+            cls._instance.reserved_margin = 0.0
+            cls._instance.loaded_at = None
+            # When the balance request of the last refresh was sent
+            cls._instance.requested_at = None
+            cls._instance.stale = False
+            cls._instance.lock = threading.Lock()
+        return cls._instance
+
+    def refresh(self, client):
+        """
+        Seed the ledger from client.balance().
+
+        :return: The raw balance list, for callers that log it.
+        """
+        requested_at = time.monotonic()
+        with stage_timer('balance'):
+            balance = client.balance()
+        for asset_info in balance:
+            if asset_info['asset'] == self.asset:
+                with self.lock:
+                    self.wallet_balance = float(asset_info['balance'])
+                    self.available_balance = float(asset_info['availableBalance'])
+                    self.loaded_at = time.monotonic()
+                    self.requested_at = requested_at
+                    self.stale = False
+                break
+        else:
+            logger.warning(f"Couldn't find balance for asset {self.asset}")
+        return balance
+
+    def apply_account_update(self, account_update):
+        for asset_balance in account_update['a'].get('B', []):
+            if asset_balance['a'] == self.asset:
+                with self.lock:
+                    self.wallet_balance = float(asset_balance['wb'])
+                    self.stale = True
+
+    def needs_refresh(self):
+        """
+        :return: True if the ledger was never seeded or an ACCOUNT_UPDATE changed the balance since.
+        """
+        return self.loaded_at is None or self.stale
+
+    def order_size(self, percent):
+        """
+        Get the USDT amount for a new order as a percentage of the wallet balance.
+
+        :return: The amount, or None if the ledger was never seeded.
+        """
+        with self.lock:
+            if self.wallet_balance is None:
+                return None
+            return self.wallet_balance / 100 * percent
+
+    def reserve(self, margin):
+        """
+        Reserve margin for an order about to be placed.
+
+        :return: True if enough margin is available, False otherwise.
+        """
+        with self.lock:
+            if self.available_balance is None:
+                return False
+            if self.available_balance - self.reserved_margin < margin:
+                logger.warning(f"Not enough available margin for {margin:.2f} {self.asset}: "
+                               f"{self.available_balance:.2f} available, {self.reserved_margin:.2f} reserved")
+                return False
+            self.reserved_margin += margin
+            return True
+
+    def commit(self, margin, placed_at):
+        """
+        :param placed_at: time.monotonic() once the order was accepted by the exchange.
+        """
+        with self.lock:
+            self.reserved_margin -= margin
+            # A balance requested after the placement already has its margin deducted
+            if self.requested_at is None or self.requested_at < placed_at:
+                self.available_balance -= margin
+
+    def release(self, margin):
+        with self.lock:
+            self.reserved_margin -= margin
@@ -0,0 +1,216 @@
+"""
+Backfill a channel's history into structured signals.
+
+Messages are streamed from a Telegram Desktop export (result.json) or a JSONL
+file (one message per line with "text" or Telethon's "message", and optionally
+"id", "date" and "format"), cut into batches and parsed by a pool of worker
+processes, each holding its own SignalParser. Like the backtest, targets and
+leverage are kept as written in the message: TARGETS_IN_USE and the leverage
+clamps are not applied, a leverage of 0 means the message had none.
+
+Parsed signals are written column by column to a compressed .npz file (one
+array per field, the variable-length targets flattened with offsets), next to
+the throughput and the unparsed rate per message format. Messages without a
+"format" field are classified from their layout.
+
+Usage: python backfill.py result.json --out signals.npz [--workers 8] [--batch-size 500]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backtest import parse_date, parse_uncapped
+from parser import SignalParser
+
+NUMBERED_TARGET_REGEX = re.compile(r'target\s*\d+\s*:', re.IGNORECASE)
+LEVERAGE_REGEX = re.compile(r'leverage|lvrg', re.IGNORECASE)
+SIGNAL_REGEX = re.compile(r'\b(buy|sell)\s+between\b', re.IGNORECASE)
+
+_worker_parser = None
+
+
+def classify_format(text):
+    """
+    Guess the layout of a message, using the labels of signal_corpus.jsonl.
+    """
+    if not SIGNAL_REGEX.search(text):
+        return 'commentary'
+    if '\n' not in text.strip():
+        return 'inline'
+    if '#' in text:
+        return 'hashtag_emoji'
+    if NUMBERED_TARGET_REGEX.search(text):
+        return 'numbered_targets'
+    leverage = LEVERAGE_REGEX.search(text)
+    if leverage is None:
+        return 'no_leverage'
+    if 'cross' in text[leverage.end():leverage.end() + 16].lower():
+        return 'cross_leverage'
+    return 'classic'
+
+
+def message_text(text):
+    # Telegram Desktop splits formatted text into plain strings and entity dicts
+    if isinstance(text, list):
+        return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+    return text or ''
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as export_file:
+        for line in export_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_messages(path):
+    """
+    Yield (message ID, timestamp, format, text) for every text message of an export.
+    """
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as export_file:
+            messages = json.load(export_file).get('messages', [])
+        lines = (message for message in messages if message.get('type', 'message') == 'message')
+    else:
+        lines = read_jsonl(path)
+
+    for index, message in enumerate(lines):
+        text = message_text(message.get('text', message.get('message')))
+        if not text:
+            continue
+        date = message.get('date_unixtime', message.get('date'))
+        timestamp = parse_date(float(date) if isinstance(date, str) and date.isdigit() else date) \
+            if date is not None else float('nan')
+        yield message.get('id', index), timestamp, message.get('format') or classify_format(text), text
+
+
+def batched(messages, size):
+    batch = []
+    for message in messages:
+        batch.append(message)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def init_worker(config_path):
+    global _worker_parser
+    logging.disable(logging.INFO)
+    _worker_parser = SignalParser(config_path)
+
+
+def parse_batch(texts):
+    """
+    :return: One tuple of signal fields per text, None where no complete signal was found.
+    """
+    records = []
+    for _, signal in parse_uncapped(_worker_parser, [(None, text) for text in texts]):
+        if signal is None or not signal.is_order():
+            records.append(None)
+            continue
+        records.append((signal.order_type, signal.currency_name, min(signal.between), max(signal.between),
+                        signal.stop_loss, signal.leverage, signal.targets))
+    return records
+
+
+class ColumnWriter:
+    """
+    Parsed signals gathered per column and saved as one compressed .npz file.
+    """
+
+    def __init__(self):
+        self.columns = {name: [] for name in ('message_id', 'date', 'format', 'side', 'symbol', 'entry_low',
+                                              'entry_high', 'stop_loss', 'leverage', 'target_offsets')}
+        self.targets = []
+
+    def append(self, message_id, timestamp, message_format, record):
+        side, symbol, entry_low, entry_high, stop_loss, leverage, targets = record
+        values = (message_id, timestamp, message_format, side, symbol, entry_low, entry_high, stop_loss, leverage,
+                  len(self.targets))
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+        self.targets.extend(targets)
+
+    def __len__(self):
+        return len(self.columns['message_id'])
+
+    def save(self, path):
+        arrays = {
+            'message_id': np.asarray(self.columns['message_id'], dtype=np.int64),
+            'date': np.asarray(self.columns['date'], dtype=np.float64),
+            'format': np.asarray(self.columns['format'], dtype=str),
+            'side': np.asarray(self.columns['side'], dtype='U4'),
+            'symbol': np.asarray(self.columns['symbol'], dtype=str),
+            'entry_low': np.asarray(self.columns['entry_low'], dtype=np.float64),
+            'entry_high': np.asarray(self.columns['entry_high'], dtype=np.float64),
+            'stop_loss': np.asarray(self.columns['stop_loss'], dtype=np.float64),
+            'leverage': np.asarray(self.columns['leverage'], dtype=np.int32),
+            # Targets of signal i are targets[target_offsets[i]:target_offsets[i + 1]]
+            'target_offsets': np.asarray(self.columns['target_offsets'] + [len(self.targets)], dtype=np.int64),
+            'targets': np.asarray(self.targets, dtype=np.float64),
+        }
+        np.savez_compressed(path, **arrays)
+
+
+def backfill(path, out_path, workers, batch_size, config_path):
+    """
+    :return: Messages read, seconds spent and per-format Counters of messages and parsed signals.
+    """
+    writer = ColumnWriter()
+    totals, parsed = Counter(), Counter()
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(config_path,)) as executor:
+        # A bounded number of batches in flight keeps memory flat on long histories
+        pending = deque()
+
+        def collect():
+            batch, future = pending.popleft()
+            for (message_id, timestamp, message_format, _), record in zip(batch, future.result()):
+                totals[message_format] += 1
+                if record is not None:
+                    parsed[message_format] += 1
+                    writer.append(message_id, timestamp, message_format, record)
+
+        for batch in batched(read_messages(path), batch_size):
+            pending.append((batch, executor.submit(parse_batch, [text for *_, text in batch])))
+            if len(pending) >= workers * 2:
+                collect()
+        while pending:
+            collect()
+
+    writer.save(out_path)
+    return sum(totals.values()), time.perf_counter() - started, totals, parsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("messages", help="Telegram Desktop result.json or JSONL export")
+    arg_parser.add_argument("--out", required=True, help="columnar .npz file to write")
+    arg_parser.add_argument("--config", default="config.yaml", help="parser keywords and regexes")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--batch-size", type=int, default=500)
+    args = arg_parser.parse_args()
+    logging.disable(logging.INFO)
+
+    count, elapsed, totals, parsed = backfill(args.messages, args.out, args.workers, args.batch_size, args.config)
+
+    print(f"{count} messages in {elapsed:.2f} s ({count / elapsed:.0f} messages/s), "
+          f"{sum(parsed.values())} signals written to {args.out}")
+    print(f"{'format':<20} {'messages':>9} {'parsed':>9} {'unparsed':>9}")
+    for message_format, total in totals.most_common():
+        print(f"{message_format:<20} {total:9} {parsed[message_format]:9} "
+              f"{1 - parsed[message_format] / total:9.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+"""
+Offline replay of channel signals over recorded klines.
+
+Exported messages go through the real SignalParser and OrderData sizing, then
+each signal is simulated the way the bot trades it:
+
+- entry: market fill when the price is inside the between zone, otherwise a
+  LIMIT at the nearest bound (new_deferred_targeted_position), cancelled once
+  the price runs past the first target (handle_expired_orders);
+- exit: the stop-loss, the targets splitting the quantity (split_target_quantities)
+  and the stop ladder of handle_filled_targets: to the entry after the first
+  target, to the previous target after each next one; isolated-margin
+  liquidation when it sits in front of the stop.
+
+Each signal's price path is reduced once with NumPy to the bar indexes where
+every target and every ladder stop would trigger. A parameter combination is
+then a few vectorized lookups over all signals, so thousands of combinations of
+PERCENT_FOR_ORDER, TARGETS_IN_USE and the leverage clamps sweep in seconds.
+
+When a stop and a target trigger in the same bar the stop is assumed first,
+a stop fills at its level or at the open of its trigger bar if the price
+gapped through it, and sizing uses a fixed starting balance so the signals are
+independent. A signal whose stop-loss is already crossed when the entry fills
+is counted as rejected and not traded: the exchange refuses such a stop
+(-2021).
+
+Messages: JSONL with "date" (ISO 8601 or epoch seconds) and "text" per line.
+Klines: CSVs in --klines named "<SYMBOL>USDT.csv" or "<SYMBOL>USDT-*.csv" (the
+Binance data dump names, e.g. SOLUSDT-1m-2024-01.csv), in the Binance data dump
+format (open_time, open, high, low, close, ...), any interval.
+
+Usage: python backtest.py messages.jsonl --klines klines/ --percent 2,5 --targets 1,2,3
+       [--min-leverage 3] [--max-leverage 5,10] [--exchange-info exchange_info.json] [--out sweep.csv]
+"""
+import argparse
+import csv
+import glob
+import itertools
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+import config
+from connector import split_target_quantities
+from order_data import OrderData
+from parser import SignalParser
+from symbol_registry import SymbolFilters
+
+NEVER = np.iinfo(np.int64).max
+
+
+def parse_date(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def load_messages(path):
+    with open(path, 'r') as messages_file:
+        messages = [json.loads(line) for line in messages_file if line.strip()]
+    return sorted(((parse_date(message['date']), message['text']) for message in messages), key=lambda m: m[0])
+
+
+def parse_uncapped(parser, messages):
+    """
+    Parse every message with the targets cap and leverage clamps lifted.
+
+    The caps are applied per parameter combination later, exactly as build_signal
+    and resolve_leverage would: a leverage of 0 means the message had none.
+    """
+    saved = config.TARGETS_IN_USE, config.MIN_LEVERAGE, config.MAX_LEVERAGE
+    config.TARGETS_IN_USE, config.MIN_LEVERAGE, config.MAX_LEVERAGE = 10 ** 6, 0, 10 ** 6
+    try:
+        return [(timestamp, parser.parse(text)) for timestamp, text in messages]
+    finally:
+        config.TARGETS_IN_USE, config.MIN_LEVERAGE, config.MAX_LEVERAGE = saved
+
+
+def load_klines(klines_dir, symbol):
+    """
+    :return: Arrays (open_time in seconds, open, high, low, close), or None without data.
+    """
+    paths = sorted(glob.glob(os.path.join(klines_dir, f"{symbol}.csv")) +
+                   glob.glob(os.path.join(klines_dir, f"{symbol}-*.csv")))
+    if not paths:
+        return None
+
+    chunks = []
+    for path in paths:
+        with open(path, 'r') as klines_file:
+            has_header = not klines_file.readline().split(',')[0].strip().isdigit()
+        chunks.append(np.loadtxt(path, delimiter=',', usecols=(0, 1, 2, 3, 4), skiprows=int(has_header), ndmin=2))
+    klines = np.concatenate(chunks)
+    klines = klines[np.argsort(klines[:, 0], kind='stable')]
+
+    open_time = klines[:, 0]
+    open_time = open_time / (1e6 if open_time[0] > 1e14 else 1e3)
+    return open_time, klines[:, 1], klines[:, 2], klines[:, 3], klines[:, 4]
+
+
+class SignalPath:
+    """
+    One signal reduced to the trigger bars of its entry, targets and ladder stops.
+
+    Prices are normalized so every position reads as a long: SELL prices are
+    negated, which turns "price fell to the target" into "price rose to it".
+    """
+
+    def __init__(self, signal, timestamp, klines, horizon, leverages):
+        self.signal = signal
+        self.direction = -1.0 if signal.order_type == 'SELL' else 1.0
+        self.raw_leverage = signal.leverage
+        self.filled = False
+        self.expired = False
+        self.rejected = False
+
+        open_time, open_price, high, low, close = klines
+        start = int(np.searchsorted(open_time, timestamp, 'left'))
+        if start >= len(open_time):
+            return
+        self.current_price = float(open_price[start])
+
+        d = self.direction
+        favourable, adverse = (high, low) if d > 0 else (-low, -high)
+        lower, upper = min(signal.between), max(signal.between)
+        targets = d * np.asarray(signal.targets, dtype=float)
+        current = d * self.current_price
+
+        # Entry as the bot places it
+        if lower <= self.current_price <= upper:
+            self.deferred = False
+            self.book_price = self.current_price
+            fill_bar, fill_price = start, current
+        else:
+            self.deferred = True
+            self.book_price = lower if self.current_price < lower else upper
+            book = d * self.book_price
+            if book >= current:
+                # Marketable LIMIT: fills straight away at the market price
+                fill_bar, fill_price = start, current
+            else:
+                end = min(len(open_time), start + horizon)
+                touched = np.flatnonzero(adverse[start:end] <= book)
+                passed = np.flatnonzero(favourable[start:end] > targets[0])
+                fill_bar = start + touched[0] if len(touched) else NEVER
+                expiry_bar = start + passed[0] if len(passed) else NEVER
+                if fill_bar == NEVER or expiry_bar < fill_bar:
+                    self.expired = expiry_bar != NEVER
+                    return
+                fill_price = book
+
+        stop_loss = d * signal.stop_loss
+        if stop_loss >= fill_price:
+            self.rejected = True
+            return
+
+        self.filled = True
+        self.fill_price = fill_price
+        self.book = d * self.book_price
+        self.targets = targets
+
+        end = min(len(open_time), fill_bar + horizon)
+        path_high, path_low = favourable[fill_bar:end], adverse[fill_bar:end]
+        path_open = d * open_price[fill_bar:end]
+        self.bars = end - fill_bar
+        self.last_close = d * float(close[end - 1])
+
+        # First bar each target is reached, in ladder order
+        running_high = np.maximum.accumulate(path_high)
+        self.hits = np.maximum.accumulate(np.searchsorted(running_high, targets, 'left'))
+
+        # Segment k runs from the k-th target fill to the next one with the stop at levels[k].
+        # The stop is checked first in the bar a target fills, so segments share it.
+        # A stop fills at its level, or at the bar's open if the bar opened past it.
+        self.levels = np.concatenate(([np.nan, self.book], targets[:-1]))
+        self.segment_stops = np.full(len(targets), NEVER, dtype=np.int64)
+        self.segment_exits = np.full(len(targets), np.nan)
+        for k in range(1, len(targets)):
+            segment_start = self.hits[k - 1]
+            if segment_start >= self.bars:
+                break
+            segment_end = min(self.hits[k], self.bars - 1)
+            stopped = np.flatnonzero(path_low[segment_start:segment_end + 1] <= self.levels[k])
+            if len(stopped):
+                self.segment_stops[k] = segment_start + stopped[0]
+                self.segment_exits[k] = min(self.levels[k], path_open[segment_start + stopped[0]])
+
+        # Segment 0 stops at the stop-loss or at liquidation, whichever is hit first
+        running_low = np.minimum.accumulate(path_low)
+        self.first_exits, self.first_stops, self.liquidated = {}, {}, {}
+        for leverage in leverages:
+            liquidation = self.fill_price * (1 - d * (1 / leverage - config.BACKTEST_MAINTENANCE_MARGIN))
+            level = max(stop_loss, liquidation)
+            index = int(np.searchsorted(-running_low, -level, 'left'))
+            self.first_stops[leverage] = index if index < self.bars else NEVER
+            self.first_exits[leverage] = min(level, path_open[index]) if index < self.bars else np.nan
+            self.liquidated[leverage] = liquidation > stop_loss
+
+
+def clamp_leverage(raw_leverage, min_leverage, max_leverage):
+    # Same rules as parser.resolve_leverage, 0 meaning no leverage in the message
+    if raw_leverage < min_leverage:
+        return min_leverage
+    return min(raw_leverage, max_leverage)
+
+
+class Sweep:
+    """
+    Vectorized evaluation of parameter combinations over prepared SignalPaths.
+    """
+
+    def __init__(self, paths, balance, precisions, max_targets):
+        self.paths = [path for path in paths if path.filled]
+        self.expired = sum(path.expired for path in paths)
+        self.rejected = sum(path.rejected for path in paths)
+        self.balance = balance
+        self.precisions = precisions
+        count = len(self.paths)
+        self.max_targets = max_targets
+
+        width = max_targets
+        self.hits = np.full((count, width), NEVER, dtype=np.int64)
+        self.segment_stops = np.full((count, width), NEVER, dtype=np.int64)
+        self.segment_exits = np.full((count, width), np.nan)
+        self.targets = np.zeros((count, width))
+        self.target_counts = np.zeros(count, dtype=np.int64)
+        for row, path in enumerate(self.paths):
+            size = min(width, len(path.targets))
+            self.target_counts[row] = size
+            self.hits[row, :size] = np.where(path.hits[:size] < path.bars, path.hits[:size], NEVER)
+            self.segment_stops[row, :size] = path.segment_stops[:size]
+            self.segment_exits[row, :size] = path.segment_exits[:size]
+            self.targets[row, :size] = path.targets[:size]
+        self.fill_prices = np.array([path.fill_price for path in self.paths])
+        self.last_closes = np.array([path.last_close for path in self.paths])
+        self.raw_leverages = np.array([path.raw_leverage for path in self.paths])
+        self.quantity_cache = {}
+
+    def quantities(self, percent, target_count):
+        """
+        Entry quantity and per-target quantities of every signal, sized by OrderData.
+        """
+        key = percent, target_count
+        if key not in self.quantity_cache:
+            totals = np.zeros(len(self.paths))
+            splits = np.zeros((len(self.paths), self.max_targets))
+            for row, path in enumerate(self.paths):
+                precision = self.precisions.get(path.signal.currency_name + 'USDT', config.BACKTEST_DEFAULT_PRECISION)
+                order_data = OrderData(signal=path.signal, usdt_quantity=self.balance / 100 * percent,
+                                       current_price=path.current_price, precision=precision)
+                quantity = order_data.calculate_deferred_quantity(path.book_price) if path.deferred \
+                    else order_data.quantity
+                count = min(target_count, len(path.targets))
+                totals[row] = quantity or 0.0
+                if quantity:
+                    splits[row, :count] = split_target_quantities(quantity, count, precision)
+            self.quantity_cache[key] = totals, splits
+        return self.quantity_cache[key]
+
+    def evaluate(self, percent, target_count, min_leverage, max_leverage):
+        rows = np.arange(len(self.paths))
+        counts = np.minimum(self.target_counts, target_count)
+        columns = np.arange(self.max_targets)
+        in_use = columns[None, :] < counts[:, None]
+
+        leverages = [clamp_leverage(raw, min_leverage, max_leverage) for raw in self.raw_leverages]
+        first_stops = np.array([path.first_stops[leverage] for path, leverage in zip(self.paths, leverages)])
+        first_exits = np.array([path.first_exits[leverage] for path, leverage in zip(self.paths, leverages)])
+        liquidations = np.array([path.liquidated[leverage] for path, leverage in zip(self.paths, leverages)])
+
+        # Segment k is stopped if its stop triggers no later than the k-th target fill
+        stopped = self.segment_stops.copy()
+        stopped[:, 0] = first_stops
+        stopped = (stopped != NEVER) & in_use
+        stopped[:, 0] &= first_stops <= self.hits[:, 0]
+        any_stop = stopped.any(axis=1)
+        stop_segment = np.argmax(stopped, axis=1)
+
+        last_hit = self.hits[rows, counts - 1]
+        all_targets = ~any_stop & (last_hit != NEVER)
+        filled_targets = np.where(any_stop, stop_segment,
+                                  np.where(all_targets, counts, ((self.hits != NEVER) & in_use).sum(axis=1)))
+
+        stop_exits = np.where(stop_segment == 0, first_exits, self.segment_exits[rows, stop_segment])
+        exit_prices = np.where(any_stop, stop_exits, self.last_closes)
+
+        totals, splits = self.quantities(percent, target_count)
+        taken = columns[None, :] < filled_targets[:, None]
+        target_quantity = np.where(taken, splits, 0.0)
+        remaining = np.where(all_targets, 0.0, totals - target_quantity.sum(axis=1))
+        gross = (target_quantity * (self.targets - self.fill_prices[:, None])).sum(axis=1) \
+            + remaining * (exit_prices - self.fill_prices)
+        turnover = totals * np.abs(self.fill_prices) + (target_quantity * np.abs(self.targets)).sum(axis=1) \
+            + remaining * np.abs(exit_prices)
+        pnl = gross - turnover * config.BACKTEST_FEE_RATE
+
+        equity = np.cumsum(pnl)
+        drawdown = np.max(np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity) if len(pnl) else 0.0
+        traded = totals > 0
+        return {
+            "percent": percent,
+            "targets_in_use": target_count,
+            "min_leverage": min_leverage,
+            "max_leverage": max_leverage,
+            "trades": int(traded.sum()),
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "stopped": int((any_stop & traded).sum()),
+            "liquidated": int((any_stop & (stop_segment == 0) & liquidations & traded).sum()),
+            "all_targets": int((all_targets & traded).sum()),
+            "win_rate": float((pnl[traded] > 0).mean()) if traded.any() else 0.0,
+            "pnl": float(pnl.sum()),
+            "max_drawdown": float(drawdown),
+        }
+
+
+def parse_list(value, kind=float):
+    return [kind(item) for item in value.split(',') if item]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("messages", help="JSONL export of the channel messages")
+    arg_parser.add_argument("--klines", required=True, help="directory of per-symbol kline CSV files")
+    arg_parser.add_argument("--config", default="config.yaml", help="parser keywords and regexes")
+    arg_parser.add_argument("--exchange-info", help="exchange_info JSON for quantity precision and notional filters")
+    arg_parser.add_argument("--balance", type=float, default=1000.0, help="USDT wallet balance used for sizing")
+    arg_parser.add_argument("--horizon-days", type=float, default=30, help="longest an entry or position is followed")
+    arg_parser.add_argument("--interval", type=float, default=60, help="kline interval in seconds")
+    arg_parser.add_argument("--percent", default=str(config.PERCENT_FOR_ORDER))
+    arg_parser.add_argument("--targets", default=str(config.TARGETS_IN_USE))
+    arg_parser.add_argument("--min-leverage", default=str(config.MIN_LEVERAGE))
+    arg_parser.add_argument("--max-leverage", default=str(config.MAX_LEVERAGE))
+    arg_parser.add_argument("--out", help="write every combination to this CSV")
+    arg_parser.add_argument("--top", type=int, default=10)
+    args = arg_parser.parse_args()
+
+    percents = parse_list(args.percent)
+    target_counts = parse_list(args.targets, int)
+    min_leverages = parse_list(args.min_leverage, int)
+    max_leverages = parse_list(args.max_leverage, int)
+    leverage_pairs = [(low, high) for low in min_leverages for high in max_leverages if 1 <= low <= high]
+    logging.disable(logging.INFO)
+
+    started = time.perf_counter()
+    parser = SignalParser(args.config)
+    signals = [(timestamp, signal) for timestamp, signal in parse_uncapped(parser, load_messages(args.messages))
+               if signal.is_order()]
+
+    precisions, allowed = {}, None
+    if args.exchange_info:
+        with open(args.exchange_info, 'r') as info_file:
+            symbols = [SymbolFilters(info) for info in json.load(info_file)['symbols']]
+        precisions = {filters.symbol: filters.quantity_precision for filters in symbols}
+        # Same filter as open_signal_position
+        allowed = {filters.symbol for filters in symbols
+                   if filters.min_notional is not None and filters.min_notional <= config.MAX_NOTIONAL}
+
+    leverages = {clamp_leverage(signal.leverage, low, high)
+                 for _, signal in signals for low, high in leverage_pairs}
+    horizon = int(args.horizon_days * 24 * 60 * 60 / args.interval)
+    klines, paths, skipped = {}, [], 0
+    for timestamp, signal in signals:
+        symbol = signal.currency_name + 'USDT'
+        if allowed is not None and symbol not in allowed:
+            skipped += 1
+            continue
+        if symbol not in klines:
+            klines[symbol] = load_klines(args.klines, symbol)
+        if klines[symbol] is None:
+            skipped += 1
+            continue
+        paths.append(SignalPath(signal, timestamp, klines[symbol], horizon, leverages))
+    prepared = time.perf_counter()
+
+    sweep = Sweep(paths, args.balance, precisions, max(target_counts))
+    results = [sweep.evaluate(percent, target_count, low, high)
+               for percent, target_count, (low, high) in itertools.product(percents, target_counts, leverage_pairs)]
+    results.sort(key=lambda result: result['pnl'], reverse=True)
+    finished = time.perf_counter()
+
+    print(f"{len(signals)} signals, {skipped} skipped without klines or over the notional filter, "
+          f"{len(sweep.paths)} filled, {sweep.expired} expired, "
+          f"{sweep.rejected} rejected with the stop already crossed")
+    print(f"Prepared paths in {prepared - started:.2f} s, swept {len(results)} combinations "
+          f"in {finished - prepared:.2f} s")
+    for result in results[:args.top]:
+        print(", ".join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                        for key, value in result.items()))
+
+    if args.out:
+        with open(args.out, 'w', newline='') as out_file:
+            writer = csv.DictWriter(out_file, fieldnames=list(results[0].keys()) if results else [])
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
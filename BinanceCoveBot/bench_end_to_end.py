@@ -0,0 +1,212 @@
+"""
+End-to-end latency benchmark against the local fake exchange.
+
+Starts fake_exchange.py in-process, then runs the bot as main.main() does,
+with the Telegram client replaced by a channel stand-in that delivers
+generated signals to main.my_event_handler at --rate signals per second. The
+real UMFutures client, RequestScheduler, user data stream and binance_loop
+talk to the fake exchange over HTTP and websocket.
+
+A share of the signals (--deferred) is priced outside the entry zone, so their
+LIMIT entry rests until the exchange fills it after --fill-delay and the exit
+bracket goes out from the user data stream. Reports p50/p99 of the time from
+message arrival to the entry and to the stop-loss being accepted by the
+exchange, the reconcile cycle durations of the poller and the request weight
+spent per signal.
+
+Usage: python bench_end_to_end.py [--signals 40] [--rate 10] [--deferred 0.25] [--latency 0.02]
+       [--reject STOP_MARKET=-2021:0.1] [--fail new_batch_order=-1001:0.05]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# main.py builds its Telegram and Binance clients at import time, from the environment
+for name, value in (('BINANCEBOT_TG_ID', '1'), ('BINANCEBOT_TG_HASH', 'bench'), ('BINANCEBOT_TARGET_CHANNEL', '-100'),
+                    ('BINANCE_API_KEY', 'bench'), ('BINANCE_API_SECRET_KEY', 'bench')):
+    os.environ.setdefault(name, value)
+
+# Databases, logs and the Telegram session are created in the working directory
+WORK_DIR = tempfile.mkdtemp(prefix='bench_end_to_end_')
+shutil.copy(os.path.join(HERE, 'config.yaml'), WORK_DIR)
+os.chdir(WORK_DIR)
+
+import config  # noqa: E402
+from fake_exchange import FakeExchangeServer, add_exchange_arguments, exchange_from_arguments  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, message_id, text):
+        self.id = message_id
+        self.text = text
+        self.message = self
+
+
+class FakeEvent:
+    """The parts of a Telethon NewMessage event the handler reads."""
+
+    def __init__(self, chat_id, message_id, text):
+        self.chat_id = chat_id
+        self.message = FakeMessage(message_id, text)
+
+
+class ChannelFeed:
+    """
+    Telegram stand-in: delivers messages to the event handler at a fixed rate.
+    """
+
+    def __init__(self, chat_id, texts, rate):
+        self.chat_id = chat_id
+        self.texts = texts
+        self.rate = rate
+        self.arrivals = {}
+
+    async def run(self, handler):
+        tasks = []
+        for message_id, (symbol, text) in enumerate(self.texts, start=1):
+            self.arrivals[symbol] = time.perf_counter()
+            tasks.append(asyncio.create_task(handler(FakeEvent(self.chat_id, message_id, text))))
+            await asyncio.sleep(1 / self.rate)
+        await asyncio.gather(*tasks)
+
+
+def signal_texts(count, deferred_share, price):
+    """
+    :return: (symbol, message) pairs, one symbol per signal.
+    """
+    texts = []
+    for index in range(count):
+        coin = f"BENCH{index}"
+        # Below the price a BUY LIMIT rests until the exchange fills it
+        low, high = (0.96, 0.98) if index < count * deferred_share else (0.99, 1.01)
+        texts.append((coin + 'USDT', (
+            f"{coin}/USDT\n"
+            f"Buy between {price * low:.4f} - {price * high:.4f}\n"
+            f"Targets: {price * 1.02:.4f} - {price * 1.04:.4f} - {price * 1.06:.4f}\n"
+            f"Stop loss: {price * 0.95:.4f}\n"
+            f"Leverage: 5x"
+        )))
+    return texts
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else float('nan')
+
+
+def report(label, seconds):
+    print(f"{label:<34} n={len(seconds):4}  p50 {percentile(seconds, 0.5) * 1e3:8.1f} ms  "
+          f"p99 {percentile(seconds, 0.99) * 1e3:8.1f} ms  max {max(seconds, default=float('nan')) * 1e3:8.1f} ms")
+
+
+async def run_bot(server, feed, settle):
+    # Imported late: main reads the endpoint URLs from config at import time
+    import main
+    from account_config import AccountConfigCache
+    from exchange_executor import run_blocking, shutdown as shutdown_executor
+    from order_poller import AdaptivePoller
+    from symbol_registry import SymbolRegistry
+    from user_stream import UserDataStream
+
+    cycles = []
+
+    class TimedPoller(AdaptivePoller):
+        def poll(self):
+            started = time.perf_counter()
+            try:
+                return super().poll()
+            finally:
+                cycles.append(time.perf_counter() - started)
+
+    main.AdaptivePoller = TimedPoller
+    SymbolRegistry().start(client=main.client, ttl=config.EXCHANGE_INFO_TTL)
+    AccountConfigCache().warm(main.client)
+
+    user_stream = UserDataStream(client=main.client, loop=asyncio.get_running_loop(), stream_url=server.stream_url)
+    await run_blocking(user_stream.start)
+    tasks = [
+        asyncio.create_task(user_stream.consume(main.on_order_update, main.on_account_update)),
+        asyncio.create_task(main.binance_loop(user_stream)),
+    ]
+    try:
+        await feed.run(main.my_event_handler)
+        # Deferred entries fill later, wait for their stops
+        deadline = time.monotonic() + settle
+        while time.monotonic() < deadline and any(
+                (symbol, 'STOP_MARKET') not in server.exchange.timeline for symbol in feed.arrivals):
+            await asyncio.sleep(0.05)
+    finally:
+        for task in tasks:
+            task.cancel()
+        user_stream.stop()
+        SymbolRegistry().stop()
+        shutdown_executor()
+    return cycles
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--signals", type=int, default=40)
+    arg_parser.add_argument("--rate", type=float, default=10, help="signals delivered per second")
+    arg_parser.add_argument("--deferred", type=float, default=0.25, help="share of signals entered with a LIMIT")
+    arg_parser.add_argument("--poll-interval", type=float, default=1, help="reconcile poll interval in seconds")
+    arg_parser.add_argument("--settle", type=float, default=10, help="seconds to wait for the last stops")
+    add_exchange_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    texts = signal_texts(args.signals, args.deferred, args.price)
+    exchange = exchange_from_arguments(args)
+    exchange.symbols.update(symbol for symbol, _ in texts)
+    server = FakeExchangeServer(exchange).start()
+    config.BINANCE_BASE_URL = server.base_url
+    config.BINANCE_STREAM_URL = server.stream_url
+    config.RECONCILE_POLL_INTERVAL = config.RECONCILE_FALLBACK_INTERVAL = args.poll_interval
+    config.RECONCILE_IDLE_INTERVAL = args.poll_interval * 4
+
+    feed = ChannelFeed(int(config.CHANNEL_USERNAME), texts, args.rate)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cycles = asyncio.run(run_bot(server, feed, args.settle))
+    elapsed = time.perf_counter() - started
+    server.stop()
+
+    timeline = exchange.timeline
+    deferred = {symbol for symbol, _ in texts[:int(args.signals * args.deferred + 0.999999)]}
+    entries, stops, fill_stops = [], {'market': [], 'deferred': []}, []
+    for symbol, arrived in feed.arrivals.items():
+        entry = timeline.get((symbol, 'LIMIT' if symbol in deferred else 'MARKET'))
+        if entry is not None:
+            entries.append(entry - arrived)
+        stop = timeline.get((symbol, 'STOP_MARKET'))
+        if stop is not None:
+            stops['deferred' if symbol in deferred else 'market'].append(stop - arrived)
+            if symbol in deferred and (symbol, 'FILLED') in timeline:
+                fill_stops.append(stop - timeline[(symbol, 'FILLED')])
+    unprotected = len(feed.arrivals) - sum(len(values) for values in stops.values())
+
+    print(f"{args.signals} signals at {args.rate:g}/s, {len(deferred)} deferred, request latency "
+          f"{args.latency * 1e3:g} ms, run {elapsed:.1f} s, {unprotected} left without a stop-loss")
+    report("message -> entry accepted", entries)
+    report("message -> stop-loss (market)", stops['market'])
+    report("message -> stop-loss (deferred)", stops['deferred'])
+    report("entry fill -> stop-loss (deferred)", fill_stops)
+    report("reconcile cycle", cycles)
+
+    total_weight = sum(exchange.weights.values())
+    print(f"request weight {total_weight}, {total_weight / args.signals:.1f} per signal")
+    for name, weight in sorted(exchange.weights.items(), key=lambda item: -item[1]):
+        print(f"  {name:<20} {exchange.calls[name]:5} calls {weight:6} weight")
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
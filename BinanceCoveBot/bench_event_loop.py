@@ -0,0 +1,166 @@
+"""
+Event loop lag benchmark.
+
+Feeds a burst of corpus signals through handle_message against a fake exchange
+client whose every call blocks for --latency seconds, while a ticker coroutine
+measures how late the event loop wakes it up. The inline mode runs the
+blocking handler directly on the loop, as handle_message did before the
+exchange executor; the executor mode is the current handle_message, which
+places different symbols concurrently. Repeated signals must open a position
+only once in both modes.
+
+Usage: python bench_event_loop.py [--latency 0.05] [--signals 12]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+import config
+
+config.ORDERS_DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_orders.db')
+config.LEGACY_ORDERS_JSON_PATH = config.ORDERS_DB_PATH + '.json'
+
+from handler import handle_message, open_signal_position  # noqa: E402
+from orders_database import OrderDB  # noqa: E402
+from parser import get_parser  # noqa: E402
+from symbol_registry import SymbolRegistry  # noqa: E402
+
+TICK = 0.01
+
+
+class RecordCollector(logging.Handler):
+    """Keeps the messages of the records logged during a run."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SlowClient:
+    """Answers like UMFutures after sleeping for the configured request latency."""
+
+    def __init__(self, latency, prices):
+        self.latency = latency
+        self.prices = prices
+        self.symbols = set(prices)
+        self.batches = 0
+        self.next_id = 0
+        self.id_lock = threading.Lock()
+
+    def _request(self):
+        time.sleep(self.latency)
+        with self.id_lock:
+            self.next_id += 1
+            return {'orderId': self.next_id}
+
+    def exchange_info(self):
+        return {'symbols': [{
+            'symbol': symbol, 'quantityPrecision': 1, 'pricePrecision': 4,
+            'filters': [{'filterType': 'MIN_NOTIONAL', 'notional': '5'}],
+        } for symbol in self.symbols]}
+
+    def balance(self):
+        time.sleep(self.latency)
+        return [{'asset': 'USDT', 'balance': '1000', 'availableBalance': '1000'}]
+
+    def ticker_price(self, symbol=None):
+        time.sleep(self.latency)
+        return {'symbol': symbol, 'price': str(self.prices.get(symbol, 1.0))}
+
+    def get_position_risk(self):
+        time.sleep(self.latency)
+        return []
+
+    def change_leverage(self, **kwargs):
+        return self._request()
+
+    def change_margin_type(self, **kwargs):
+        return self._request()
+
+    def new_order(self, **kwargs):
+        return self._request()
+
+    def new_batch_order(self, batchOrders):
+        time.sleep(self.latency)
+        with self.id_lock:
+            self.batches += 1
+        return [self._request() for _ in batchOrders]
+
+
+class Message:
+    def __init__(self, text):
+        self.message = self
+        self.text = text
+
+
+async def handle_inline(client, event):
+    # Former behaviour: the blocking handler body runs on the event loop
+    signal = get_parser().parse(event.message.text)
+    if signal.is_order():
+        open_signal_position(client, signal)
+
+
+async def measure(handler, client, events):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - started - TICK)
+
+    ticker_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(client, event) for event in events))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker_task
+    return elapsed, max(lags), sorted(lags)[len(lags) // 2]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="seconds each exchange call blocks")
+    arg_parser.add_argument("--signals", type=int, default=12)
+    args = arg_parser.parse_args()
+    logging.disable(logging.WARNING)
+    # Errors are collected instead of printed
+    errors = RecordCollector()
+    logging.getLogger().handlers = [errors]
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'signal_corpus.jsonl'), 'r') as corpus:
+        texts = [json.loads(line)['text'] for line in corpus if line.strip()]
+    texts = (texts * (args.signals // len(texts) + 1))[:args.signals]
+    # Every symbol trades inside its entry zone, so positions open at market with a batch bracket
+    signals = [get_parser().parse(text) for text in texts]
+    client = SlowClient(args.latency, {signal.currency_name + 'USDT': sum(signal.between) / 2
+                                       for signal in signals if signal.is_order()})
+    SymbolRegistry().start(client=client, ttl=3600)
+
+    for name, handler in (('inline', handle_inline), ('executor', handle_message)):
+        OrderDB().clear_active_orders()
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, max_lag, median_lag = asyncio.run(measure(handler, client, [Message(text) for text in texts]))
+        print(f"{name:>8}: {len(texts)} signals in {elapsed:6.2f} s, "
+              f"{len(OrderDB().get_active_orders())} positions opened, "
+              f"loop lag max {max_lag * 1e3:7.1f} ms, median {median_lag * 1e3:6.1f} ms")
+
+    # A failing batch falls back to per-leg orders, which is not the path being measured
+    assert client.batches, "no bracket went out as a batch"
+    fallbacks = [message for message in errors.messages if message.startswith("Batch bracket placement failed")]
+    assert not fallbacks, f"bracket batches failed during the run: {fallbacks[0]}"
+
+
+if __name__ == '__main__':
+    main()
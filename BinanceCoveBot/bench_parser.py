@@ -0,0 +1,90 @@
+"""
+Parser benchmarks.
+
+Reports per-message parse latency for the old path (read config.yaml and
+compile every regex per message), the cached per-category regexes and the
+single-pass extractor, then the throughput over the channel message corpus
+in signal_corpus.jsonl. The extractor output is checked against the
+per-category regexes for every corpus message.
+
+Usage: python bench_parser.py [iterations]
+"""
+import sys
+import json
+import time
+import logging
+
+from parser import SignalParser
+
+SAMPLE_MESSAGE = (
+    "SOL/USDT\n"
+    "Buy between 142.5 - 145.2\n"
+    "Targets: 148.0 - 151.5 - 155.0 - 160.0\n"
+    "Stop loss: 138.9\n"
+    "Leverage: 5x-10x"
+)
+
+
+def load_corpus(path="signal_corpus.jsonl"):
+    with open(path, "r", encoding="utf-8") as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def bench(label, parse, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse(SAMPLE_MESSAGE)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed / iterations * 1e6:10.1f} us/message")
+    return elapsed
+
+
+def bench_corpus(label, parse, messages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            parse(message)
+    elapsed = time.perf_counter() - started
+    rate = len(messages) * rounds / elapsed
+    print(f"{label:<28} {rate:10.0f} messages/s")
+    return rate
+
+
+def check_corpus(parser, corpus):
+    mismatches = 0
+    for entry in corpus:
+        expected = str(parser.parse_with_regexes(entry["text"]))
+        actual = str(parser.extractor.extract(entry["text"]))
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH [{entry['format']}]\n  regexes:   {expected}\n  extractor: {actual}")
+    print(f"corpus check: {len(corpus) - mismatches}/{len(corpus)} messages identical")
+    return mismatches
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logging.disable(logging.INFO)
+
+    parser = SignalParser()
+    corpus = load_corpus()
+    mismatches = check_corpus(parser, corpus)
+
+    print("\nper-message latency")
+    before = bench("reload config per message", lambda text: SignalParser().parse_with_regexes(text),
+                   iterations)
+    cached = bench("cached regexes", parser.parse_with_regexes, iterations)
+    single_pass = bench("single-pass extractor", parser.extractor.extract, iterations)
+    print(f"speedup vs reload: {before / single_pass:.1f}x, vs cached regexes: {cached / single_pass:.2f}x")
+
+    print("\ncorpus throughput")
+    messages = [entry["text"] for entry in corpus]
+    rounds = max(1, iterations // len(messages))
+    bench_corpus("cached regexes", parser.parse_with_regexes, messages, rounds)
+    bench_corpus("single-pass extractor", parser.extractor.extract, messages, rounds)
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
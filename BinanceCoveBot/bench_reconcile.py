@@ -0,0 +1,88 @@
+"""
+Reconcile diff benchmark.
+
+Builds a synthetic book of open positions (pending entries, filled entries with
+live targets, hit stops and filled targets) and times the former list-based
+membership checks of check_for_updates against reconcile.compute_diff.
+
+Usage: python bench_reconcile.py [order counts...]   (default: 1000 10000)
+"""
+import sys
+import time
+import random
+import logging
+
+from reconcile import compute_diff
+
+
+def build_book(count, seed=7):
+    rng = random.Random(seed)
+    local_orders = []
+    remote_active_orders = []
+    next_id = 1
+    for index in range(count):
+        entry_id, stop_id, target_ids = next_id, next_id + 1, [next_id + 2, next_id + 3, next_id + 4]
+        next_id += 5
+        pending = index % 4 == 0
+        order = {
+            "symbol": f"C{index}",
+            "open_position_order": {"order_id": entry_id, "status": "placed" if pending else "filled",
+                                    "side": "BUY", "open_price": 1.0},
+            "targets": [{"order_id": None if pending else target_id, "status": "pending" if pending else "placed",
+                         "target_price": 1.1 + 0.1 * number} for number, target_id in enumerate(target_ids)],
+            "stop_loss": {"order_id": None if pending else stop_id, "value": 0.9,
+                          "status": "pending" if pending else "placed"},
+        }
+        local_orders.append(order)
+
+        # About 2% of the legs left the book since the last cycle
+        legs = [entry_id] if pending else [stop_id] + target_ids
+        remote_active_orders.extend({"orderId": leg_id} for leg_id in legs if rng.random() > 0.02)
+    return local_orders, remote_active_orders
+
+
+def legacy_scan(local_active_orders, remote_active_orders):
+    # Same membership checks as the former handle_* functions, on lists
+    open_position_orders = []
+    for order in local_active_orders:
+        open_position_orders.append(order)
+    remote_order_ids = [order['orderId'] for order in remote_active_orders]
+
+    stops, entries, targets = [], [], []
+    for order in local_active_orders:
+        if order['stop_loss']['order_id'] is not None and order['stop_loss']['order_id'] not in remote_order_ids:
+            stops.append(order)
+    for order in open_position_orders:
+        if order['open_position_order']['order_id'] not in remote_order_ids:
+            if order['open_position_order']['status'] != 'filled':
+                entries.append(order)
+    for order in local_active_orders:
+        if not all(target['status'] == 'filled' for target in order['targets']):
+            for index, target in enumerate(order['targets']):
+                if target['order_id'] not in remote_order_ids and target['status'] == 'placed':
+                    targets.append((order, index))
+    return stops, entries, targets
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    logging.disable(logging.INFO)
+
+    for count in counts:
+        local_orders, remote_active_orders = build_book(count)
+        legacy_time, _ = timed(legacy_scan, local_orders, remote_active_orders)
+        diff_time, diff = timed(
+            lambda: compute_diff(local_orders, {order['orderId'] for order in remote_active_orders})
+        )
+        print(f"{count:>6} open orders: list scan {legacy_time * 1e3:10.1f} ms, "
+              f"compute_diff {diff_time * 1e3:8.2f} ms ({legacy_time / diff_time:.0f}x), {diff}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Request scheduler check against a local mock exchange that enforces rate limits.
+
+The mock counts request weight and order count in clock-aligned windows like
+Binance and answers 429 once a window is over its limit. Polling threads flood
+it with full get_orders() calls while a protector places a stop-loss and
+cancels it every --period seconds. Time is scaled down: the weight window lasts
+--window seconds instead of a minute.
+
+Run directly, then through RequestScheduler: the direct client gets rate
+limited and its stops fail with it, the scheduler defers polling and keeps
+every stop going through.
+
+Usage: python bench_scheduler.py [--seconds 6] [--window 2] [--weight-limit 400]
+"""
+import argparse
+import threading
+import time
+import logging
+
+from binance.error import ClientError
+
+from request_scheduler import RequestScheduler, REQUEST_WEIGHTS, ORDER_METHODS
+
+
+class MockExchange:
+    """Answers like UMFutures(show_limit_usage=True) and enforces the limits it reports."""
+
+    def __init__(self, weight_limit, window, order_limit, order_window):
+        self.weight_limit = weight_limit
+        self.window = window
+        self.order_limit = order_limit
+        self.order_window = order_window
+        self.lock = threading.Lock()
+        self.used = {}
+        self.orders = {}
+        self.rejected = 0
+
+    def _count(self, counters, interval, cost):
+        window = int(time.time() // interval)
+        counters[window] = counters.get(window, 0) + cost
+        return counters[window]
+
+    def _request(self, name, data, **kwargs):
+        params = dict(kwargs, args=())
+        weight = REQUEST_WEIGHTS.get(name, lambda _: 1)(params)
+        orders = ORDER_METHODS.get(name, lambda _: 0)(params)
+        with self.lock:
+            used = self._count(self.used, self.window, weight)
+            order_count = self._count(self.orders, self.order_window, orders)
+            if used > self.weight_limit or order_count > self.order_limit:
+                self.rejected += 1
+                raise ClientError(429, -1003, "Too many requests", {'Retry-After': str(self.window)})
+        time.sleep(0.005)
+        return {
+            'limit_usage': {'x-mbx-used-weight-1m': str(used), 'x-mbx-order-count-10s': str(order_count)},
+            'data': data,
+        }
+
+    def get_orders(self, **kwargs):
+        return self._request('get_orders', [], **kwargs)
+
+    def new_order(self, **kwargs):
+        return self._request('new_order', {'orderId': 1, 'type': kwargs.get('type')}, **kwargs)
+
+    def cancel_order(self, **kwargs):
+        return self._request('cancel_order', {'orderId': kwargs.get('orderId')}, **kwargs)
+
+
+def unwrap(result):
+    return result['data'] if isinstance(result, dict) and 'data' in result else result
+
+
+def run(client, exchange, seconds, period, pollers):
+    stop_at = time.monotonic() + seconds
+    stops = {'placed': 0, 'failed': 0, 'latency': []}
+    polls = {'done': 0, 'failed': 0}
+
+    def poll():
+        while time.monotonic() < stop_at:
+            try:
+                unwrap(client.get_orders())
+                polls['done'] += 1
+            except ClientError:
+                polls['failed'] += 1
+                time.sleep(0.05)
+
+    def protect():
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                unwrap(client.new_order(symbol='XRPUSDT', side='SELL', type='STOP_MARKET', quantity=1, stopPrice=0.5))
+                unwrap(client.cancel_order(symbol='XRPUSDT', orderId=1))
+                stops['placed'] += 1
+                stops['latency'].append(time.perf_counter() - started)
+            except ClientError:
+                stops['failed'] += 1
+            time.sleep(period)
+
+    threads = [threading.Thread(target=poll) for _ in range(pollers)] + [threading.Thread(target=protect)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stops, polls
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--seconds", type=float, default=6)
+    arg_parser.add_argument("--window", type=float, default=2, help="length of the mock weight window in seconds")
+    arg_parser.add_argument("--weight-limit", type=int, default=400)
+    arg_parser.add_argument("--period", type=float, default=0.2, help="seconds between protective stop placements")
+    arg_parser.add_argument("--pollers", type=int, default=4)
+    args = arg_parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    for name in ('direct', 'scheduled'):
+        exchange = MockExchange(args.weight_limit, args.window, order_limit=300, order_window=10)
+        client = exchange
+        if name == 'scheduled':
+            client = RequestScheduler(exchange, weight_limit=args.weight_limit, order_limit=300,
+                                      weight_interval=args.window, order_interval=10)
+        stops, polls = run(client, exchange, args.seconds, args.period, args.pollers)
+        worst = max(stops['latency']) * 1e3 if stops['latency'] else float('nan')
+        print(f"{name:>9}: {exchange.rejected:4} rejected with 429, stops placed {stops['placed']:3} "
+              f"failed {stops['failed']:3} (worst {worst:6.1f} ms), polls done {polls['done']:4} "
+              f"failed {polls['failed']:4}")
+        if name == 'scheduled':
+            assert exchange.rejected == 0, "the scheduler let a request exceed the limits"
+            assert stops['failed'] == 0, "a protective order was rate limited"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+CANCEL_BATCH_LIMIT = 10
+
+# Separate from the exchange executor: flushes run on its threads and must not wait on them
+_executor = ThreadPoolExecutor(max_workers=config.CANCEL_WORKERS, thread_name_prefix='cancel')
+
+
+def cancel_symbol_orders(client, symbol, order_ids):
+    """
+    Cancel orders of one symbol, at most CANCEL_BATCH_LIMIT per batch request.
+
+    :param symbol: The exchange symbol, e.g. 'BTCUSDT'.
+    :param order_ids: IDs of the orders to cancel.
+    :return: The set of IDs cancelled.
+    """
+    cancelled = set()
+    if len(order_ids) == 1:
+        # A single cancel is cheaper than a batch of one
+        try:
+            client.cancel_order(symbol=symbol, orderId=order_ids[0])
+            cancelled.add(order_ids[0])
+        except Exception as e:
+            logger.error(f"Failed to cancel order (ID: {order_ids[0]}) for {symbol}: {e}")
+        return cancelled
+
+    for index in range(0, len(order_ids), CANCEL_BATCH_LIMIT):
+        chunk = order_ids[index:index + CANCEL_BATCH_LIMIT]
+        try:
+            results = client.cancel_batch_order(symbol=symbol, orderIdList=chunk, origClientOrderIdList=None)
+        except Exception as e:
+            logger.error(f"Failed to cancel orders {chunk} for {symbol}: {e}")
+            continue
+
+        for order_id, result in zip(chunk, results):
+            if 'orderId' in result:
+                cancelled.add(order_id)
+            else:
+                logger.error(f"Failed to cancel order (ID: {order_id}) for {symbol}: {result}")
+    return cancelled
+
+
+class CancelBatch:
+    """
+    Pending cancels grouped per symbol.
+
+    flush() sends one batch cancel per symbol and the symbols concurrently, so
+    a stop-out with three live targets costs one round trip instead of three.
+    """
+
+    def __init__(self):
+        self.order_ids = {}
+
+    def add(self, symbol, order_id):
+        """
+        :param symbol: The coin name without the quote asset, e.g. 'BTC'.
+        :param order_id: The exchange order ID to cancel.
+        """
+        self.order_ids.setdefault(symbol + 'USDT', []).append(order_id)
+
+    def __len__(self):
+        return sum(len(order_ids) for order_ids in self.order_ids.values())
+
+    def flush(self, client):
+        """
+        Send every pending cancel.
+
+        :return: The set of IDs cancelled.
+        """
+        groups, self.order_ids = self.order_ids, {}
+        if not groups:
+            return set()
+        if len(groups) == 1:
+            symbol, order_ids = next(iter(groups.items()))
+            return cancel_symbol_orders(client, symbol, order_ids)
+
+        cancelled = set()
+        futures = [_executor.submit(cancel_symbol_orders, client, symbol, order_ids)
+                   for symbol, order_ids in groups.items()]
+        for future in futures:
+            cancelled |= future.result()
+        logger.info(f"Cancelled {len(cancelled)} orders over {len(groups)} symbols")
+        return cancelled
@@ -9,9 +9,41 @@ PHONE_NUMBER = os.getenv('BINANCEBOT_TG_PHONE_NUMBER')
 CHANNEL_USERNAME = os.getenv('BINANCEBOT_TARGET_CHANNEL')
 BINANCE_API_KEY = os.getenv('BINANCE_API_KEY')
 BINANCE_API_SECRET = os.getenv('BINANCE_API_SECRET_KEY')
+BINANCE_BASE_URL = os.getenv('BINANCE_BASE_URL', 'https://fapi.binance.com')
+BINANCE_STREAM_URL = os.getenv('BINANCE_STREAM_URL', 'wss://fstream.binance.com')
+METRICS_HOST = os.getenv('BINANCEBOT_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('BINANCEBOT_METRICS_PORT', '0'))
+LOG_PATH = os.getenv('BINANCEBOT_LOG_PATH', 'cove_bot.log')
+LOG_LEVEL = os.getenv('BINANCEBOT_LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('BINANCEBOT_LOG_FORMAT', 'text')  # or 'json'
+LOG_ROTATION = os.getenv('BINANCEBOT_LOG_ROTATION', 'size')  # or 'time'
 
 MAX_NOTIONAL = 20
 PERCENT_FOR_ORDER = 5
 TARGETS_IN_USE = 3
 MIN_LEVERAGE = 3
 MAX_LEVERAGE = 5
+EXCHANGE_INFO_TTL = 3600
+ACCOUNT_CONFIG_TTL = 3600
+BRACKET_BATCH_ORDERS = True
+RECONCILE_POLL_INTERVAL = 60
+RECONCILE_FALLBACK_INTERVAL = 10
+RECONCILE_IDLE_INTERVAL = 300
+LISTEN_KEY_KEEPALIVE = 30 * 60
+EVENT_LOOP_LAG_INTERVAL = 1
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = 'midnight'
+LOG_BACKUP_COUNT = 7
+EXCHANGE_WORKERS = 8
+CANCEL_WORKERS = 4
+REQUEST_WEIGHT_LIMIT = 2400
+ORDER_COUNT_LIMIT_10S = 300
+ORDERS_DB_PATH = 'active_orders.db'
+LEGACY_ORDERS_JSON_PATH = 'active_orders.json'
+SEEN_MESSAGES_DB_PATH = 'seen_messages.db'
+SEEN_MESSAGES_RETENTION_DAYS = 30
+SEEN_MESSAGES_CAPACITY = 100_000
+SEEN_MESSAGES_ERROR_RATE = 0.01
+BACKTEST_FEE_RATE = 0.0005
+BACKTEST_MAINTENANCE_MARGIN = 0.005
+BACKTEST_DEFAULT_PRECISION = 3
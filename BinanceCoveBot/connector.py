@@ -2,10 +2,16 @@ from order_data import OrderData
 from binance.um_futures import UMFutures as Client
 from binance.error import ClientError
 from orders_database import OrderDB
+from account_config import AccountConfigCache
+from symbol_registry import SymbolRegistry
+from metrics import stage_timer, timed
 from logging_config import logging
+import config
 
 logger = logging.getLogger(__name__)
 
+BATCH_ORDERS_LIMIT = 5
+
 
 def get_usdt_balance(client, asset='USDT'):
     balance = client.balance()
@@ -29,7 +35,14 @@ def get_coin_price(client, symbol):
         return None
 
 
+@timed('targets')
 def place_target_orders(client: Client, symbol, side, targets, quantity, precision):
+    """
+    Place one LIMIT order per target, falling back to MARKET on -2021.
+
+    :return: A list with one entry per target, in order: the LIMIT order, the
+             MARKET fallback order, or None if the leg failed.
+    """
     placed_orders = []
     targeted_asset = 0
     for index, target_price in enumerate(targets):
@@ -37,6 +50,8 @@ def place_target_orders(client: Client, symbol, side, targets, quantity, precisi
             target_quantity = int(round(quantity / len(targets), precision))
         else:
             target_quantity = round(quantity / len(targets), precision)
+        leg_quantity = target_quantity if index < len(targets) - 1 else round(quantity - targeted_asset, 3)
+        order = None
         try:
             order = client.new_order(
                 symbol=symbol + 'USDT',
@@ -44,14 +59,10 @@ def place_target_orders(client: Client, symbol, side, targets, quantity, precisi
                 type='LIMIT',
                 timeInForce='GTC',
                 price=target_price,
-                quantity=target_quantity if index < len(targets) - 1 else round(quantity - targeted_asset, 3),
+                quantity=leg_quantity,
             )
 
-            placed_orders.append(order)
-            targeted_asset += target_quantity
             logging.info(f"TP order placed for symbol {symbol}: {order}")
-        except Exception as e:
-            logging.error(f"Error placing target order {index + 1} for {symbol}: {e}")
         except ClientError as e:
             # Check for specific error code
             if e.error_code == -2021 and "Order would immediately trigger." in str(e):
@@ -60,7 +71,7 @@ def place_target_orders(client: Client, symbol, side, targets, quantity, precisi
                         symbol=symbol + 'USDT',
                         side='SELL' if side == 'BUY' else 'BUY',
                         type='MARKET',
-                        quantity=target_quantity if index < len(targets) - 1 else round(quantity - targeted_asset, 3),
+                        quantity=leg_quantity,
                     )
 
                     logging.warning(
@@ -71,47 +82,239 @@ def place_target_orders(client: Client, symbol, side, targets, quantity, precisi
             else:
                 # Handle other ClientErrors
                 logging.error(f"Error placing target order {index + 1} for {symbol}: {e}")
+        except Exception as e:
+            logging.error(f"Error placing target order {index + 1} for {symbol}: {e}")
+
+        placed_orders.append(order)
+        if order is not None:
+            targeted_asset += target_quantity
     return placed_orders
 
 
-def new_market_targeted_position(client, order_data: OrderData):
-    client.change_leverage(symbol=order_data.signal.currency_name + 'USDT', leverage=order_data.signal.leverage)
-    logging.info(f"Setting leverage to {order_data.signal.leverage} for {order_data.signal.currency_name}")
+def split_target_quantities(quantity, targets_count, precision):
+    if precision == 0:
+        target_quantity = int(round(quantity / targets_count, precision))
+    else:
+        target_quantity = round(quantity / targets_count, precision)
+    # The last target closes whatever is left after rounding
+    return [target_quantity] * (targets_count - 1) + [round(quantity - target_quantity * (targets_count - 1), 3)]
+
+
+def build_stop_loss_payload(symbol, side, quantity, stop_price):
+    return {
+        "symbol": symbol + 'USDT',
+        "side": 'SELL' if side == 'BUY' else 'BUY',
+        "type": 'STOP_MARKET',
+        "quantity": str(quantity),
+        "stopPrice": str(stop_price),
+    }
+
+
+def build_target_payloads(symbol, side, targets, quantity, precision):
+    return [
+        {
+            "symbol": symbol + 'USDT',
+            "side": 'SELL' if side == 'BUY' else 'BUY',
+            "type": 'LIMIT',
+            "timeInForce": 'GTC',
+            "price": str(target_price),
+            "quantity": str(target_quantity),
+        }
+        for target_price, target_quantity in zip(targets, split_target_quantities(quantity, len(targets), precision))
+    ]
+
+
+def submit_batch_orders(client, payloads):
+    """
+    Submit orders through batch_orders, at most BATCH_ORDERS_LIMIT per request.
+
+    :return: One result per payload, in the same order. A result is either the
+             placed order or an error dict with 'code' and 'msg'.
+    """
+    results = []
+    for index in range(0, len(payloads), BATCH_ORDERS_LIMIT):
+        results.extend(client.new_batch_order(batchOrders=payloads[index:index + BATCH_ORDERS_LIMIT]))
+    return results
+
+
+def build_exit_bracket(symbol, side, quantity, stop_price, targets, precision):
+    """
+    Compute the stop-loss and target payloads that protect a position once its entry fills.
+
+    Prices are rounded to the symbol's price precision and every leg is checked
+    against its filters, so the bracket can be sent as is the moment the entry fills.
+
+    :return: Dict with the 'stop_loss' payload and the list of 'targets' payloads.
+    :raises ValueError: If a leg would be rejected by the exchange.
+    """
+    symbol_filters = SymbolRegistry().get(symbol + 'USDT')
+    if symbol_filters is not None:
+        stop_price = round(stop_price, symbol_filters.price_precision)
+        targets = [round(target_price, symbol_filters.price_precision) for target_price in targets]
+
+    # The stop must sit on the losing side of every target
+    if side == 'BUY' and not all(stop_price < target_price for target_price in targets) or \
+            side == 'SELL' and not all(stop_price > target_price for target_price in targets):
+        raise ValueError(f"Stop price {stop_price} is on the wrong side of targets {targets} for a {side} position")
+
+    stop_loss_payload = build_stop_loss_payload(symbol, side, quantity, stop_price)
+    target_payloads = build_target_payloads(symbol, side, targets, quantity, precision)
+    for payload in [stop_loss_payload] + target_payloads:
+        leg_quantity = float(payload['quantity'])
+        leg_price = float(payload.get('price', payload.get('stopPrice')))
+        if leg_quantity <= 0:
+            raise ValueError(f"Leg quantity {leg_quantity} of {symbol} is not positive")
+        if symbol_filters is None:
+            continue
+        if symbol_filters.min_qty is not None and leg_quantity < symbol_filters.min_qty:
+            raise ValueError(f"Leg quantity {leg_quantity} of {symbol} is below the minimum {symbol_filters.min_qty}")
+        if symbol_filters.min_price is not None and leg_price < symbol_filters.min_price or \
+                symbol_filters.max_price and leg_price > symbol_filters.max_price:
+            raise ValueError(f"Leg price {leg_price} of {symbol} is outside the price filter")
+
+    return {"stop_loss": stop_loss_payload, "targets": target_payloads}
+
+
+def place_bracket_orders(client, symbol, side, quantity, stop_price, targets, precision):
+    """
+    Place the stop-loss and every target of a filled position in a single batch.
+
+    :return: See submit_bracket.
+    """
+    stop_loss_payload = build_stop_loss_payload(symbol, side, quantity, stop_price)
+    target_payloads = build_target_payloads(symbol, side, targets, quantity, precision)
+    return submit_bracket(client, symbol, stop_loss_payload, target_payloads, precision)
+
+
+@timed('exit_bracket')
+def submit_bracket(client, symbol, stop_loss_payload, target_payloads, precision):
+    """
+    Submit prepared stop-loss and target payloads in a single batch.
+
+    Legs rejected with -2021 (would immediately trigger) fall back the same way
+    as place_stop_loss_order and place_target_orders do. If the batch request
+    itself fails, every leg is placed one by one instead.
+
+    :return: The stop-loss order (or None) and a list with one entry per target:
+             the LIMIT order, the MARKET fallback order, or None if it failed.
+    """
+    # Payload sides close the position, the per-leg helpers take the position side
+    side = 'BUY' if stop_loss_payload['side'] == 'SELL' else 'SELL'
+    stop_price = stop_loss_payload['stopPrice']
 
     try:
-        client.change_margin_type(symbol=order_data.signal.currency_name + 'USDT', marginType='ISOLATED')
+        results = submit_batch_orders(client, [stop_loss_payload] + target_payloads)
     except Exception as e:
-        if 'No need to change margin type.' in str(e):
-            logging.info("Margin type already set to ISOLATED.")
+        logging.error(f"Batch bracket placement failed for {symbol}, placing legs one by one: {e}")
+        stop_loss_order = place_stop_loss_order(client, symbol, side, stop_loss_payload['quantity'], stop_price)
+        target_orders = []
+        for payload in target_payloads:
+            target_orders.extend(
+                place_target_orders(client, symbol, side, [payload['price']], float(payload['quantity']), precision))
+        return stop_loss_order, target_orders
+
+    stop_loss_order = results[0] if 'orderId' in results[0] else None
+    if stop_loss_order is None:
+        if results[0].get('code') == -2021:
+            logging.error(
+                f"Stop-loss order not placed because price already reached stop price ({stop_price}) for {symbol}.")
+        else:
+            logging.error(f"Failed to place stop-loss order for {symbol}: {results[0]}")
+
+    target_orders = []
+    for index, (payload, result) in enumerate(zip(target_payloads, results[1:])):
+        if 'orderId' in result:
+            target_orders.append(result)
+            logging.info(f"TP order placed for symbol {symbol}: {result}")
+        elif result.get('code') == -2021:
+            try:
+                market_order = client.new_order(
+                    symbol=payload['symbol'],
+                    side=payload['side'],
+                    type='MARKET',
+                    quantity=payload['quantity'],
+                )
+                target_orders.append(market_order)
+                logging.warning(
+                    f"Target price {payload['price']} for {symbol} might be too close to current market price. Place.")
+            except Exception as e:
+                target_orders.append(None)
+                logging.error(f"Error placing target order {index + 1} for {symbol}: {e}")
         else:
-            logging.error(f"Error changing margin type for {order_data.signal.currency_name}: {e}")
-            raise e  # Re-raise other exceptions
+            target_orders.append(None)
+            logging.error(f"Error placing target order {index + 1} for {symbol}: {result}")
 
-    order = client.new_order(
-        symbol=order_data.signal.currency_name + 'USDT',
-        side=order_data.signal.order_type,
-        type='MARKET',
-        quantity=order_data.quantity
-    )
-    stop_loss_order = place_stop_loss_order(
-        client=client,
-        symbol=order_data.signal.currency_name,
-        side=order_data.signal.order_type,
-        quantity=order_data.quantity,
-        stop_price=order_data.signal.stop_loss,
-    )
-    target_orders = place_target_orders(client, order_data.signal.currency_name, order_data.signal.order_type,
-                                        order_data.signal.targets, order_data.quantity, order_data.precision)
+    return stop_loss_order, target_orders
 
-    order_db = OrderDB()
+
+def bracket_targets(target_prices, target_orders):
+    """
+    Build the stored targets of a position from the orders placed for them.
+
+    :param target_prices: The target prices, in order.
+    :param target_orders: The placed orders, see submit_bracket.
+    :return: A list of target dicts for OrderDB.
+    """
     targets = []
-    for index, target_price in enumerate(order_data.signal.targets):
+    for index, target_price in enumerate(target_prices):
+        target_order = target_orders[index] if index < len(target_orders) else None
+        if target_order is None:
+            status = 'failed'
+        elif target_order.get('type') == 'MARKET':
+            status = 'filled'
+        else:
+            status = 'placed'
         target = {
-            "order_id": target_orders[index]['orderId'],
-            "status": "placed",
+            "order_id": target_order['orderId'] if target_order is not None else None,
+            "status": status,
             "target_price": target_price
         }
         targets.append(target)
+    return targets
+
+
+def new_market_targeted_position(client, order_data: OrderData):
+    # Leverage and margin type calls are skipped when the account is already set up
+    account_config = AccountConfigCache()
+    if account_config.ensure_leverage(client, order_data.signal.currency_name + 'USDT', order_data.signal.leverage):
+        logging.info(f"Setting leverage to {order_data.signal.leverage} for {order_data.signal.currency_name}")
+
+    try:
+        account_config.ensure_margin_type(client, order_data.signal.currency_name + 'USDT', 'ISOLATED')
+    except Exception as e:
+        logging.error(f"Error changing margin type for {order_data.signal.currency_name}: {e}")
+        raise e  # Re-raise other exceptions
+
+    with stage_timer('entry_order'):
+        order = client.new_order(
+            symbol=order_data.signal.currency_name + 'USDT',
+            side=order_data.signal.order_type,
+            type='MARKET',
+            quantity=order_data.quantity
+        )
+    if config.BRACKET_BATCH_ORDERS:
+        stop_loss_order, target_orders = place_bracket_orders(
+            client=client,
+            symbol=order_data.signal.currency_name,
+            side=order_data.signal.order_type,
+            quantity=order_data.quantity,
+            stop_price=order_data.signal.stop_loss,
+            targets=order_data.signal.targets,
+            precision=order_data.precision,
+        )
+    else:
+        stop_loss_order = place_stop_loss_order(
+            client=client,
+            symbol=order_data.signal.currency_name,
+            side=order_data.signal.order_type,
+            quantity=order_data.quantity,
+            stop_price=order_data.signal.stop_loss,
+        )
+        target_orders = place_target_orders(client, order_data.signal.currency_name, order_data.signal.order_type,
+                                            order_data.signal.targets, order_data.quantity, order_data.precision)
+
+    order_db = OrderDB()
+    targets = bracket_targets(order_data.signal.targets, target_orders)
 
     order_db.store_active_order(
         symbol=order_data.signal.currency_name,
@@ -119,8 +322,8 @@ def new_market_targeted_position(client, order_data: OrderData):
         open_position_order_status='filled',
         open_position_side=order_data.signal.order_type,
         targets=targets,
-        stop_loss_id=stop_loss_order['orderId'],
-        stop_loss_status='placed',
+        stop_loss_id=stop_loss_order['orderId'] if stop_loss_order else None,
+        stop_loss_status='placed' if stop_loss_order else 'pending',
         stop_loss_value=order_data.signal.stop_loss,
         precision=order_data.precision,
         quantity=float(order_data.quantity),
@@ -131,35 +334,45 @@ def new_market_targeted_position(client, order_data: OrderData):
 
 
 def new_deferred_targeted_position(client, order_data: OrderData):
-    try:
-        client.change_leverage(symbol=order_data.signal.currency_name + 'USDT', leverage=order_data.signal.leverage)
-    except Exception as e:  # Catch any error during leverage change
-        logging.error(f"Error changing leverage: {e}")
-
-    try:
-        client.change_margin_type(symbol=order_data.signal.currency_name + 'USDT', marginType='ISOLATED')
-    except Exception as e:  # Catch any error during margin type change
-        if 'No need to change margin type.' in str(e):
-            logging.info("Margin type is already set to ISOLATED. No need to change.")
-        else:
-            logging.error(f"Error changing margin type: {e}")
-
     lower_bound = min(order_data.signal.between)
     higher_bound = max(order_data.signal.between)
     entry_price = lower_bound if order_data.current_price < lower_bound else higher_bound
 
     order_data.quantity = order_data.calculate_deferred_quantity(entry_price)
 
-    order = client.new_order(
-        symbol=order_data.signal.currency_name + 'USDT',
+    # Prepared now so the bracket goes out in one batch the moment the entry fills,
+    # an entry whose exit would be rejected is not placed at all
+    exit_bracket = build_exit_bracket(
+        symbol=order_data.signal.currency_name,
         side=order_data.signal.order_type,
-        type='LIMIT',  # Change from 'MARKET' to 'LIMIT'
-        timeInForce='GTC',  # Good 'Til Canceled, or you can use 'IOC' (Immediate or Cancel) or 'FOK' (Fill or Kill)
         quantity=order_data.quantity,
-        price=entry_price,
+        stop_price=order_data.signal.stop_loss,
+        targets=order_data.signal.targets,
+        precision=order_data.precision,
     )
 
-    print("Order placed successfully:", order)
+    account_config = AccountConfigCache()
+    try:
+        account_config.ensure_leverage(client, order_data.signal.currency_name + 'USDT', order_data.signal.leverage)
+    except Exception as e:  # Catch any error during leverage change
+        logging.error(f"Error changing leverage: {e}")
+
+    try:
+        account_config.ensure_margin_type(client, order_data.signal.currency_name + 'USDT', 'ISOLATED')
+    except Exception as e:  # Catch any error during margin type change
+        logging.error(f"Error changing margin type: {e}")
+
+    with stage_timer('entry_order'):
+        order = client.new_order(
+            symbol=order_data.signal.currency_name + 'USDT',
+            side=order_data.signal.order_type,
+            type='LIMIT',  # Change from 'MARKET' to 'LIMIT'
+            timeInForce='GTC',  # Good 'Til Canceled, or you can use 'IOC' (Immediate or Cancel) or 'FOK' (Fill or Kill)
+            quantity=order_data.quantity,
+            price=entry_price,
+        )
+
+    logging.info(f"Order placed successfully: {order}")
 
     order_db = OrderDB()
 
@@ -182,42 +395,13 @@ def new_deferred_targeted_position(client, order_data: OrderData):
         precision=order_data.precision,
         quantity=float(order_data.quantity),
         open_price=entry_price,
+        exit_bracket=exit_bracket,
     )
 
     logging.info(f"Order {order['orderId']} placed as deferred order")
 
 
-def get_precision(info, symbol):
-    try:
-        # Iterate over symbols in the exchange information
-        for x in info['symbols']:
-            # Check if the symbol matches the one we are interested in
-            if x['symbol'] == symbol:
-                # Return the precision of the quantity for this symbol
-                return int(x['quantityPrecision'])
-
-        # If the symbol is not found
-        raise ValueError(f"Symbol '{symbol}' not found in exchange information.")
-    except Exception as e:
-        logging.error(f"Error getting precision for {symbol}: {e}")
-        raise  # Re-raise the exception for critical functions
-
-
-def get_min_notional(info, symbol):
-    try:
-        for x in info['symbols']:
-            if x['symbol'] == symbol:
-                for notional_filter in x['filters']:
-                    if notional_filter['filterType'] == "MIN_NOTIONAL":
-                        return int(notional_filter['notional'])
-                # Minimum notional not found in filters, return None
-                return None
-        raise ValueError(f"Symbol '{symbol}' not found in exchange information.")
-    except Exception as e:
-        logging.error("An error occurred:", e)
-        return None
-
-
+@timed('stop_loss')
 def place_stop_loss_order(client, symbol, side, quantity, stop_price):
     try:
         order = client.new_order(
@@ -237,25 +421,10 @@ def place_stop_loss_order(client, symbol, side, quantity, stop_price):
             logging.error(f"Failed to place stop-loss order: {e}", e)
 
 
-def cancel_target_orders(client, remote_order_ids, symbol, targets):
+def queue_target_cancels(batch, remote_order_ids, symbol, targets):
     for target in targets:
-        if target['order_id'] in remote_order_ids:
-            if target['status'] == 'placed':
-                try:
-                    client.cancel_order(symbol=symbol + 'USDT', orderId=target['order_id'])
-                    logging.info(f"Target order (ID: {target['order_id']}) cancelled successfully.")
-                except Exception as e:
-                    logging.error(f"Failed to cancel target order (ID: {target['order_id']}):", e)
-
-
-def cancel_expired_order(client, order):
-    symbol = order['symbol']
-
-    try:
-        client.cancel_order(symbol=symbol + 'USDT', orderId=order['open_position_order']['order_id'])
-
-    except Exception as e:
-        logging.error(f"Failed to cancel expired order (ID: {order['open_position_order']['order_id']}. Cause: {e}")
+        if target['order_id'] in remote_order_ids and target['status'] == 'placed':
+            batch.add(symbol, target['order_id'])
 
 
 def modify_stop_loss_order(client, symbol, side, order, new_stop_price, quantity):
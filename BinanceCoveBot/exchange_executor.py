@@ -0,0 +1,110 @@
+import asyncio
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+# The UMFutures client is synchronous: its calls run on a bounded pool so the
+# Telethon loop keeps serving updates while requests are in flight. The pool is
+# smaller than the client's HTTP connection pool, so keep-alive connections are reused.
+_executor = ThreadPoolExecutor(max_workers=config.EXCHANGE_WORKERS, thread_name_prefix='exchange')
+
+
+class OrderStateGate:
+    """
+    Readers-writer gate over the order state.
+
+    Signal placements take it shared, so positions on different symbols open
+    concurrently. Reconcile cycles read the exchange and then write the order
+    store, so they take it alone and never see a placement half done. A waiting
+    reconcile cycle blocks new placements so it can't be starved by a burst.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextlib.asynccontextmanager
+    async def shared(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._shared -= 1
+                self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        async with self._condition:
+            self._exclusive_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+            finally:
+                self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+_order_state_gate = OrderStateGate()
+# Signals for one symbol run one at a time, so the duplicate check and the
+# placement of a signal are atomic with respect to its copies. Each entry is
+# [lock, holders and waiters], removed once the last of them is done
+_symbol_locks = {}
+
+
+async def run_blocking(function, *args, **kwargs):
+    """
+    Run a blocking call on the exchange thread pool.
+
+    :param function: Callable, e.g. a connector function or a client method.
+    :return: The result of the call.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(function, *args, **kwargs))
+
+
+async def run_exclusive(function, *args, **kwargs):
+    """
+    Run a blocking call on the exchange thread pool with the order state to
+    itself: no placement or other reconcile call runs meanwhile.
+    """
+    async with _order_state_gate.exclusive():
+        return await run_blocking(function, *args, **kwargs)
+
+
+async def run_for_symbol(symbol, function, *args, **kwargs):
+    """
+    Run a blocking call on the exchange thread pool, concurrently with calls for
+    other symbols but serialized with calls for the same symbol.
+
+    :param symbol: The coin the call opens or changes orders for.
+    """
+    entry = _symbol_locks.get(symbol)
+    if entry is None:
+        entry = _symbol_locks[symbol] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            async with _order_state_gate.shared():
+                return await run_blocking(function, *args, **kwargs)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _symbol_locks[symbol]
+
+
+def shutdown():
+    _executor.shutdown(wait=True)
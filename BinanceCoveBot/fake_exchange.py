@@ -0,0 +1,473 @@
+"""
+Local stand-in for the Binance USD-M futures REST API and user data stream.
+
+Serves the endpoints the bot uses over HTTP, so the real UMFutures client,
+RequestScheduler and connector code run unchanged against it, and pushes
+ORDER_TRADE_UPDATE events for fills over a websocket like the user data stream.
+
+- every symbol trades at --price, exchange info lists the --symbols and those traded;
+- MARKET orders fill at once, LIMIT orders that cross the price too;
+- resting LIMIT entries fill after --fill-delay seconds, targets and stops rest;
+- STOP_MARKET orders whose stop price is already crossed are rejected with
+  -2021, and --reject TYPE=CODE:RATE rejects a share of any order type
+  (alone or inside a batch) with the given error code;
+- --latency delays every request, --endpoint-latency NAME=SECONDS one endpoint,
+  --fail NAME=CODE:RATE fails a share of the requests of one endpoint;
+- request weight and order count are tracked in clock-aligned windows, reported
+  in the usage headers and enforced with 429.
+
+Endpoints are named after the UMFutures methods (new_order, get_orders...).
+Point the bot at it with BINANCE_BASE_URL=http://127.0.0.1:8080 and
+BINANCE_STREAM_URL=ws://127.0.0.1:8765.
+
+Usage: python fake_exchange.py [--port 8080] [--ws-port 8765] [--latency 0.02] [--fill-delay 1]
+       [--reject STOP_MARKET=-2021:0.1] [--fail new_batch_order=-1001:0.05]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import config
+from request_scheduler import REQUEST_WEIGHTS, ORDER_METHODS
+from ws_replay_server import handshake, drain_client_frames, text_frame
+
+ENDPOINTS = {
+    ('GET', '/fapi/v1/exchangeInfo'): 'exchange_info',
+    ('GET', '/fapi/v1/ticker/price'): 'ticker_price',
+    ('GET', '/fapi/v2/balance'): 'balance',
+    ('GET', '/fapi/v2/account'): 'account',
+    ('GET', '/fapi/v2/positionRisk'): 'get_position_risk',
+    ('POST', '/fapi/v1/leverage'): 'change_leverage',
+    ('POST', '/fapi/v1/marginType'): 'change_margin_type',
+    ('POST', '/fapi/v1/order'): 'new_order',
+    ('GET', '/fapi/v1/order'): 'query_order',
+    ('DELETE', '/fapi/v1/order'): 'cancel_order',
+    ('POST', '/fapi/v1/batchOrders'): 'new_batch_order',
+    ('DELETE', '/fapi/v1/batchOrders'): 'cancel_batch_order',
+    ('GET', '/fapi/v1/openOrder'): 'get_open_orders',
+    ('GET', '/fapi/v1/openOrders'): 'get_orders',
+    ('POST', '/fapi/v1/listenKey'): 'new_listen_key',
+    ('PUT', '/fapi/v1/listenKey'): 'renew_listen_key',
+    ('DELETE', '/fapi/v1/listenKey'): 'close_listen_key',
+}
+
+ERROR_MESSAGES = {
+    -1001: "Internal error; unable to process your request. Please try again.",
+    -2011: "Unknown order sent.",
+    -2013: "Order does not exist.",
+    -2019: "Margin is insufficient.",
+    -2021: "Order would immediately trigger.",
+    -4046: "No need to change margin type.",
+}
+
+
+class ExchangeError(Exception):
+    def __init__(self, code, status=400):
+        super().__init__(ERROR_MESSAGES.get(code, "Rejected by the fake exchange."))
+        self.code = code
+        self.status = status
+
+    def body(self):
+        return {'code': self.code, 'msg': str(self)}
+
+
+def parse_rates(specs):
+    """
+    :param specs: Strings like 'STOP_MARKET=-2021:0.1'.
+    :return: A dict of name to (error code, rate).
+    """
+    rates = {}
+    for spec in specs or ():
+        name, rule = spec.split('=', 1)
+        code, rate = rule.split(':', 1)
+        rates[name] = (int(code), float(rate))
+    return rates
+
+
+class FakeExchange:
+    """
+    Order book state and endpoint handlers, independent of the transport.
+    """
+
+    def __init__(self, price=1.0, balance=1000.0, quantity_precision=1, fill_delay=1.0, latency=0.0,
+                 endpoint_latency=None, rejects=None, failures=None, weight_limit=None, order_limit=None,
+                 seed=None):
+        self.price = price
+        self.balance = balance
+        self.quantity_precision = quantity_precision
+        self.fill_delay = fill_delay
+        self.latency = latency
+        self.endpoint_latency = endpoint_latency or {}
+        self.rejects = rejects or {}
+        self.failures = failures or {}
+        self.weight_limit = weight_limit or config.REQUEST_WEIGHT_LIMIT
+        self.order_limit = order_limit or config.ORDER_COUNT_LIMIT_10S
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.order_ids = itertools.count(1)
+        self.symbols = set()
+        self.orders = {}
+        self.positions = {}
+        self.leverage = {}
+        self.margin_type = {}
+        self.used_weight = {}
+        self.order_count = {}
+        self.subscribers = []
+
+        # Calls and weight per endpoint, and the first time each (symbol, order type or 'FILLED')
+        # was seen, for the benchmarks
+        self.calls = {}
+        self.weights = {}
+        self.timeline = {}
+
+    # Transport hooks
+
+    def request(self, name, params):
+        """
+        Serve one request.
+
+        :return: HTTP status, JSON body and usage headers.
+        """
+        time.sleep(self.endpoint_latency.get(name, self.latency))
+        weight = REQUEST_WEIGHTS.get(name, lambda _: 1)(dict(params, args=()))
+        orders = ORDER_METHODS.get(name, lambda _: 0)(params)
+        with self.lock:
+            window = int(time.time() // 60)
+            order_window = int(time.time() // 10)
+            used = self.used_weight[window] = self.used_weight.get(window, 0) + weight
+            order_count = self.order_count[order_window] = self.order_count.get(order_window, 0) + orders
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.weights[name] = self.weights.get(name, 0) + weight
+        headers = {'X-MBX-USED-WEIGHT-1M': str(used), 'X-MBX-ORDER-COUNT-10S': str(order_count)}
+
+        if used > self.weight_limit or order_count > self.order_limit:
+            return 429, {'code': -1003, 'msg': "Too many requests."}, dict(headers, **{'Retry-After': '60'})
+        try:
+            self._maybe_fail(self.failures.get(name))
+            handler = getattr(self, 'on_' + name, None)
+            if handler is None:
+                raise ExchangeError(-1000, status=404)
+            return 200, handler(params), headers
+        except ExchangeError as e:
+            return e.status, e.body(), headers
+
+    def subscribe(self, callback):
+        """
+        :param callback: Called with every user data event, from the thread that caused it.
+        """
+        self.subscribers.append(callback)
+
+    def _publish(self, event):
+        for callback in self.subscribers:
+            callback(event)
+
+    def _maybe_fail(self, rule):
+        if rule is not None and self.random.random() < rule[1]:
+            raise ExchangeError(rule[0])
+
+    # Market data and account
+
+    def on_exchange_info(self, params):
+        return {'symbols': [{
+            'symbol': symbol, 'quantityPrecision': self.quantity_precision, 'pricePrecision': 4,
+            'filters': [{'filterType': 'MIN_NOTIONAL', 'notional': '5'}],
+        } for symbol in sorted(self.symbols)]}
+
+    def on_ticker_price(self, params):
+        if 'symbol' in params:
+            return {'symbol': params['symbol'], 'price': str(self.price), 'time': int(time.time() * 1000)}
+        return [{'symbol': symbol, 'price': str(self.price)} for symbol in sorted(self.symbols)]
+
+    def on_balance(self, params):
+        return [{'asset': 'USDT', 'balance': str(self.balance), 'availableBalance': str(self.balance)}]
+
+    def on_account(self, params):
+        return {'assets': self.on_balance(params), 'positions': self.on_get_position_risk(params)}
+
+    def on_get_position_risk(self, params):
+        with self.lock:
+            return [{
+                'symbol': symbol,
+                'positionAmt': str(self.positions.get(symbol, 0.0)),
+                'entryPrice': str(self.price),
+                'markPrice': str(self.price),
+                'leverage': str(self.leverage.get(symbol, 20)),
+                'marginType': self.margin_type.get(symbol, 'cross'),
+            } for symbol in sorted(self.symbols)]
+
+    def on_change_leverage(self, params):
+        self.leverage[params['symbol']] = int(params['leverage'])
+        return {'symbol': params['symbol'], 'leverage': int(params['leverage'])}
+
+    def on_change_margin_type(self, params):
+        margin_type = params['marginType'].lower()
+        if self.margin_type.get(params['symbol']) == margin_type:
+            raise ExchangeError(-4046)
+        self.margin_type[params['symbol']] = margin_type
+        return {'code': 200, 'msg': 'success'}
+
+    def on_new_listen_key(self, params):
+        return {'listenKey': 'fake-listen-key'}
+
+    def on_renew_listen_key(self, params):
+        return {}
+
+    def on_close_listen_key(self, params):
+        return {}
+
+    # Orders
+
+    def place(self, payload):
+        """
+        Accept or reject one order, as new_order or one leg of new_batch_order would.
+        """
+        symbol, side, order_type = payload['symbol'], payload['side'], payload['type']
+        self._maybe_fail(self.rejects.get(order_type))
+        sign = 1 if side == 'BUY' else -1
+        if order_type == 'STOP_MARKET' and sign * (self.price - float(payload['stopPrice'])) >= 0:
+            raise ExchangeError(-2021)
+
+        order = {
+            'orderId': next(self.order_ids),
+            'symbol': symbol,
+            'side': side,
+            'type': order_type,
+            'status': 'NEW',
+            'price': str(payload.get('price', '0')),
+            'stopPrice': str(payload.get('stopPrice', '0')),
+            'origQty': str(payload['quantity']),
+            'updateTime': int(time.time() * 1000),
+        }
+        with self.lock:
+            self.symbols.add(symbol)
+            self.timeline.setdefault((symbol, order_type), time.perf_counter())
+            position = self.positions.get(symbol, 0.0)
+            crosses = order_type == 'LIMIT' and sign * (float(order['price']) - self.price) >= 0
+            if order_type == 'MARKET' or crosses:
+                self._fill(order)
+            else:
+                self.orders[order['orderId']] = order
+        if order_type == 'LIMIT' and order['status'] == 'NEW' and position * sign >= 0:
+            # A resting entry: the price comes to it after the fill delay
+            timer = threading.Timer(self.fill_delay, self._fill_resting, (order['orderId'],))
+            timer.daemon = True
+            timer.start()
+        return order
+
+    def _fill(self, order):
+        order['status'] = 'FILLED'
+        quantity = float(order['origQty'])
+        self.positions[order['symbol']] = round(
+            self.positions.get(order['symbol'], 0.0) + (quantity if order['side'] == 'BUY' else -quantity), 8)
+
+    def _fill_resting(self, order_id):
+        with self.lock:
+            order = self.orders.pop(order_id, None)
+            if order is None:
+                return
+            self._fill(order)
+            self.timeline.setdefault((order['symbol'], 'FILLED'), time.perf_counter())
+        self._publish({
+            'e': 'ORDER_TRADE_UPDATE',
+            'E': int(time.time() * 1000),
+            'o': {
+                's': order['symbol'], 'S': order['side'], 'o': order['type'], 'ot': order['type'],
+                'q': order['origQty'], 'p': order['price'], 'ap': order['price'], 'sp': order['stopPrice'],
+                'x': 'TRADE', 'X': 'FILLED', 'i': order['orderId'], 'l': order['origQty'], 'z': order['origQty'],
+            },
+        })
+
+    def on_new_order(self, params):
+        return self.place(params)
+
+    def on_new_batch_order(self, params):
+        results = []
+        for payload in params['batchOrders']:
+            try:
+                results.append(self.place(payload))
+            except ExchangeError as e:
+                results.append(e.body())
+        return results
+
+    def _cancel(self, symbol, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order['symbol'] != symbol:
+                raise ExchangeError(-2011)
+            del self.orders[order_id]
+        return dict(order, status='CANCELED')
+
+    def on_cancel_order(self, params):
+        return self._cancel(params['symbol'], int(params['orderId']))
+
+    def on_cancel_batch_order(self, params):
+        results = []
+        for order_id in params['orderIdList']:
+            try:
+                results.append(self._cancel(params['symbol'], int(order_id)))
+            except ExchangeError as e:
+                results.append(e.body())
+        return results
+
+    def on_query_order(self, params):
+        return self.on_get_open_orders(params)
+
+    def on_get_open_orders(self, params):
+        order = self.orders.get(int(params['orderId']))
+        if order is None or order['symbol'] != params['symbol']:
+            raise ExchangeError(-2013)
+        return order
+
+    def on_get_orders(self, params):
+        with self.lock:
+            return [order for order in self.orders.values()
+                    if 'symbol' not in params or order['symbol'] == params['symbol']]
+
+
+def decode_params(query):
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    for key in ('batchOrders', 'orderIdList'):
+        if key in params:
+            params[key] = json.loads(params[key])
+    params.pop('signature', None)
+    params.pop('timestamp', None)
+    return params
+
+
+def http_handler(exchange):
+    class Handler(BaseHTTPRequestHandler):
+        def _serve(self):
+            url = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+            params = decode_params('&'.join(part for part in (url.query, body) if part))
+            name = ENDPOINTS.get((self.command, url.path))
+            status, data, headers = exchange.request(name, params) if name else \
+                (404, {'code': -1000, 'msg': f"Unknown endpoint {self.command} {url.path}"}, {})
+
+            payload = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeExchangeServer:
+    """
+    HTTP and websocket front of a FakeExchange, each served from a daemon thread.
+    """
+
+    def __init__(self, exchange, host='127.0.0.1', port=0, ws_port=0):
+        self.exchange = exchange
+        self.http = ThreadingHTTPServer((host, port), http_handler(exchange))
+        self.http.daemon_threads = True
+        self.host = host
+        self.ws_port = ws_port
+        self.ws_loop = asyncio.new_event_loop()
+        self.ws_clients = set()
+        self.ws_ready = threading.Event()
+        exchange.subscribe(self._broadcast)
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.http.server_address[1]}"
+
+    @property
+    def stream_url(self):
+        return f"ws://{self.host}:{self.ws_port}"
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, name='fake-exchange-http', daemon=True).start()
+        threading.Thread(target=self._run_ws, name='fake-exchange-ws', daemon=True).start()
+        self.ws_ready.wait()
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+        self.ws_loop.call_soon_threadsafe(self.ws_loop.stop)
+
+    def _run_ws(self):
+        asyncio.set_event_loop(self.ws_loop)
+        server = self.ws_loop.run_until_complete(asyncio.start_server(self._serve_ws, self.host, self.ws_port))
+        self.ws_port = server.sockets[0].getsockname()[1]
+        self.ws_ready.set()
+        self.ws_loop.run_forever()
+
+    async def _serve_ws(self, reader, writer):
+        await handshake(reader, writer)
+        self.ws_clients.add(writer)
+        try:
+            await drain_client_frames(reader, writer)
+        except ConnectionError:
+            pass
+        finally:
+            self.ws_clients.discard(writer)
+            writer.close()
+
+    def _broadcast(self, event):
+        frame = text_frame(json.dumps(event))
+
+        def send():
+            for writer in list(self.ws_clients):
+                writer.write(frame)
+
+        self.ws_loop.call_soon_threadsafe(send)
+
+
+def parse_latencies(value):
+    return {name: float(seconds) for name, seconds in (item.split('=', 1) for item in value.split(',') if item)}
+
+
+def add_exchange_arguments(arg_parser):
+    arg_parser.add_argument("--price", type=float, default=1.0, help="price of every symbol")
+    arg_parser.add_argument("--fill-delay", type=float, default=1.0, help="seconds before a resting entry fills")
+    arg_parser.add_argument("--latency", type=float, default=0.02, help="seconds every request takes")
+    arg_parser.add_argument("--endpoint-latency", default="", help="per endpoint, e.g. new_batch_order=0.08,get_orders=0.05")
+    arg_parser.add_argument("--reject", action='append', help="order type rejection, e.g. STOP_MARKET=-2021:0.1")
+    arg_parser.add_argument("--fail", action='append', help="endpoint failure, e.g. new_batch_order=-1001:0.05")
+    arg_parser.add_argument("--seed", type=int, default=1)
+
+
+def exchange_from_arguments(args):
+    return FakeExchange(price=args.price, fill_delay=args.fill_delay, latency=args.latency,
+                        endpoint_latency=parse_latencies(args.endpoint_latency), rejects=parse_rates(args.reject),
+                        failures=parse_rates(args.fail), seed=args.seed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--ws-port", type=int, default=8765)
+    arg_parser.add_argument("--symbols", default="", help="comma separated symbols listed before any order")
+    add_exchange_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    exchange = exchange_from_arguments(args)
+    exchange.symbols.update(symbol for symbol in args.symbols.split(',') if symbol)
+    server = FakeExchangeServer(exchange, args.host, args.port, args.ws_port).start()
+    print(f"Fake exchange on {server.base_url}, user data stream on {server.stream_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,18 @@
-from connector import get_usdt_balance, get_coin_price, new_market_targeted_position, new_deferred_targeted_position, \
-    get_precision, place_target_orders, modify_stop_loss_order, cancel_target_orders, get_min_notional, \
-    place_stop_loss_order, cancel_expired_order
-from parser import parse_message
+import time
+from connector import get_coin_price, new_market_targeted_position, new_deferred_targeted_position, \
+    place_target_orders, modify_stop_loss_order, queue_target_cancels, place_stop_loss_order, \
+    submit_bracket, bracket_targets
+from parser import get_parser
 from order_data import OrderData
-from orders_database import OrderDB
+from orders_database import OrderDB, order_leg_ids
+from symbol_registry import SymbolRegistry
+from account_ledger import AccountLedger
+from reconcile import compute_diff
+from cancellation import CancelBatch
+from exchange_executor import run_for_symbol
+from price_snapshot import PriceSnapshot
+from positions_snapshot import PositionsSnapshot
+from metrics import stage_timer, timed
 from logging_config import logging
 import config
 
@@ -12,189 +21,291 @@ logger = logging.getLogger(__name__)
 
 async def handle_message(client, event):
     # Parse the message and extract useful data
-    signal = parse_message(event.message.text)
+    with stage_timer('parse'):
+        signal = get_parser().parse(event.message.text)
     if signal.is_order():
-        active_orders = OrderDB().get_active_orders()
-
-        order_handled = None
-        for order in active_orders:
-            if signal.compare(
-                    symbol=order['symbol'],
-                    side=order['open_position_order']['side'],
-                    open_price=order['open_position_order']['open_price'],
-                    stop_loss=order['stop_loss']['value'],
-            ):
-                logger.info(f"Such signal already handled!")
-                order_handled = True
-                break
-
-        if order_handled is not True:
-            usdt_balance = get_usdt_balance(client=client)
-            usdt_for_order = usdt_balance / 100 * config.PERCENT_FOR_ORDER
+        # Signals for different coins are placed concurrently, copies of one signal one at a time
+        await run_for_symbol(signal.currency_name, open_signal_position, client, signal)
+
+
+def open_signal_position(client, signal):
+    """
+    Open a position for a parsed signal unless the same signal is already active.
+
+    Blocking, called from handle_message through the exchange executor.
+    """
+    if OrderDB().find_signal_duplicate(signal) is not None:
+        logger.info(f"Such signal already handled!")
+    else:
+        ledger = AccountLedger()
+        if ledger.needs_refresh():
+            ledger.refresh(client)
+        usdt_for_order = ledger.order_size(config.PERCENT_FOR_ORDER)
+        if usdt_for_order is None:
+            logger.warning(f"No {ledger.asset} balance to size the order on, skipping signal for {signal.currency_name}")
+            return
+
+        # Margin is reserved first so concurrent signals can't over-allocate the balance
+        margin = usdt_for_order / signal.leverage
+        if not ledger.reserve(margin):
+            return
+
+        placed_at = None
+        try:
             current_price = get_coin_price(client=client, symbol=signal.currency_name)
-
-            try:
-                info = client.exchange_info()
-                if info is not None:
-                    min_notional = get_min_notional(info=info, symbol=signal.currency_name + 'USDT')
-                    if min_notional is not None and min_notional <= config.MAX_NOTIONAL:
-                        current_order_data = OrderData(
-                            signal=signal,
-                            usdt_quantity=usdt_for_order,
-                            current_price=current_price,
-                            precision=get_precision(info=info, symbol=signal.currency_name + 'USDT'),
-                        )
-                        if min(signal.between) <= current_price <= max(signal.between):
-                            new_market_targeted_position(client=client, order_data=current_order_data)
-                        else:
-                            new_deferred_targeted_position(client=client, order_data=current_order_data)
+            symbol_filters = SymbolRegistry().get(signal.currency_name + 'USDT')
+            if symbol_filters is not None:
+                min_notional = symbol_filters.min_notional
+                if min_notional is not None and min_notional <= config.MAX_NOTIONAL:
+                    current_order_data = OrderData(
+                        signal=signal,
+                        usdt_quantity=usdt_for_order,
+                        current_price=current_price,
+                        precision=symbol_filters.quantity_precision,
+                    )
+                    if min(signal.between) <= current_price <= max(signal.between):
+                        new_market_targeted_position(client=client, order_data=current_order_data)
                     else:
-                        logger.info(f":Min notional is {min_notional}")
-
-            except Exception as e:
-                logger.error(f"Error in handle_message: {e}")
-
+                        new_deferred_targeted_position(client=client, order_data=current_order_data)
+                    placed_at = time.monotonic()
+                else:
+                    logger.info(f":Min notional is {min_notional}")
 
-def handle_expired_orders(client, active_orders):
-    for order in active_orders:
-        current_price = get_coin_price(client=client, symbol=order['symbol'])
+        except Exception as e:
+            logger.error(f"Error in open_signal_position: {e}")
+        finally:
+            if placed_at is not None:
+                ledger.commit(margin, placed_at)
+            else:
+                ledger.release(margin)
+
+
+@timed('handle_expired_orders')
+def handle_expired_orders(client, expired_orders):
+    # Entries of every symbol are cancelled together, then removed
+    batch = CancelBatch()
+    for order in expired_orders:
+        batch.add(order['symbol'], order['open_position_order']['order_id'])
+    batch.flush(client)
+
+    for order in expired_orders:
+        try:
+            OrderDB().remove_completed_order(order['open_position_order']['order_id'])
+        except Exception as e:
+            logger.error(f"Error in handle_expired_orders for order {order['symbol']}: {e}")
 
-        if order['open_position_order']['status'] == 'placed' and current_price > order['targets'][0]['target_price']:
 
-            try:
-                cancel_expired_order(
-                    client=client,
-                    order=order,
-                )
+@timed('handle_order_trade_update')
+def handle_order_trade_update(client, order_update):
+    """
+    Reconcile the single local order affected by an ORDER_TRADE_UPDATE event.
 
-                OrderDB().remove_completed_order(order['open_position_order']['order_id'])
-            except Exception as e:
-                logger.error(f"Error in handle_message: {e}")
+    The diff is computed against a remote view that only lacks the filled leg,
+    so it acts exactly as the polling path would for that one fill.
+    """
+    if order_update['X'] != 'FILLED':
+        return
 
+    # Order IDs are only unique per symbol
+    symbol = order_update['s']
+    if not symbol.endswith('USDT'):
+        return
 
-def check_for_updates(client, remote_active_orders):
+    order_id = order_update['i']
     orders_db = OrderDB()
-    local_active_orders = orders_db.get_active_orders()
+    with orders_db.transaction():
+        order = orders_db.get_order_by_leg_id(symbol[:-len('USDT')], order_id)
+        if order is None or order['symbol'] + 'USDT' != symbol:
+            return
 
-    # Get and compare local and remote position orders
-    open_position_orders = []
-    for order in local_active_orders:
-        open_position_orders.append(order)
-    remote_order_ids = [order['orderId'] for order in remote_active_orders]
+        logger.info(f"Order {order_id} for {order['symbol']} filled, reconciling from user data stream")
+        apply_diff(client, compute_diff([order], order_leg_ids(order) - {order_id}), confirmed_fills={order_id})
 
-    if local_active_orders and open_position_orders:
-        try:
-            handle_filled_stop(client, local_active_orders, remote_order_ids)
-            handle_entered_positions(client, open_position_orders, remote_order_ids)
-            handle_filled_targets(client, local_active_orders, remote_order_ids)
 
-            open_position_orders = []
-            for order in local_active_orders:
-                open_position_orders.append(order)
+@timed('handle_account_update')
+def handle_account_update(client, account_update):
+    """
+    Reconcile the symbols whose position was closed according to an ACCOUNT_UPDATE event.
+    """
+    AccountLedger().apply_account_update(account_update)
+    for position in account_update['a'].get('P', []):
+        symbol = position['s']
+        if float(position['pa']) == 0.0 and symbol.endswith('USDT'):
+            reconcile_symbol(client, symbol[:-len('USDT')])
 
-            handle_expired_orders(client, open_position_orders)
-        except Exception as e:
-            logger.error(f"Error in check_for_updates: {e}")
 
+def reconcile_symbol(client, symbol):
+    local_orders = OrderDB().get_orders_by_symbol(symbol)
+    if not local_orders:
+        return
 
-# Functions for handling filled stops, entered positions, and filled targets
+    remote_active_orders = client.get_orders(symbol=symbol + 'USDT')
+    check_for_updates(client, remote_active_orders, local_active_orders=local_orders)
 
 
-def handle_filled_stop(client, local_active_orders, remote_order_ids):
-    for order in local_active_orders:
-        if order['stop_loss']['order_id'] is not None and order['stop_loss']['order_id'] not in remote_order_ids:
+@timed('check_for_updates')
+def check_for_updates(client, remote_active_orders, local_active_orders=None):
+    orders_db = OrderDB()
+    # All DB changes of one reconcile cycle are flushed together at the end
+    with orders_db.transaction():
+        if local_active_orders is None:
+            local_active_orders = orders_db.get_active_orders()
+
+        if local_active_orders:
             try:
-                cancel_target_orders(client, remote_order_ids, order['symbol'], order['targets'])
-                OrderDB().remove_completed_order(order['open_position_order']['order_id'])
+                remote_order_ids = {order['orderId'] for order in remote_active_orders}
+                # One ticker request per cycle for every expiry check
+                diff = compute_diff(local_active_orders, remote_order_ids, price_of=PriceSnapshot(client).price_of)
+                apply_diff(client, diff)
             except Exception as e:
-                logger.error(f"Error in handle_filled_stop for order {order['symbol']}: {e}")
+                logger.error(f"Error in check_for_updates: {e}")
+
 
+def apply_diff(client, diff, confirmed_fills=()):
+    """
+    :param confirmed_fills: IDs of the orders known to be filled, from the user data stream.
+    """
+    # Entries and targets filled in this cycle share one position request
+    positions = PositionsSnapshot(client)
+    handle_filled_stop(client, diff.stops_hit, diff.remote_order_ids)
+    handle_entered_positions(client, diff.entries_filled, positions, confirmed_fills)
+    handle_filled_targets(client, diff.targets_filled, positions)
+    handle_completed_orders(diff.completed)
+    handle_expired_orders(client, diff.expired)
+
+
+# Functions for handling filled stops, entered positions, and filled targets
 
-def handle_filled_targets(client, local_active_orders, remote_order_ids):
+
+@timed('handle_filled_stop')
+def handle_filled_stop(client, stopped_orders, remote_order_ids):
+    # Remaining targets of every stopped order are cancelled together, then the orders removed
+    batch = CancelBatch()
+    for order in stopped_orders:
+        queue_target_cancels(batch, remote_order_ids, order['symbol'], order['targets'])
+    try:
+        batch.flush(client)
+    except Exception as e:
+        logger.error(f"Error cancelling targets in handle_filled_stop: {e}")
+
+    for order in stopped_orders:
+        try:
+            OrderDB().remove_completed_order(order['open_position_order']['order_id'])
+        except Exception as e:
+            logger.error(f"Error in handle_filled_stop for order {order['symbol']}: {e}")
+
+
+def handle_completed_orders(completed_orders):
     order_db = OrderDB()
+    for order in completed_orders:
+        order_db.remove_completed_order(order['open_position_order']['order_id'])
 
-    for order in local_active_orders:
-        if all(target['status'] == 'filled' for target in order['targets']):
-            order_db.remove_completed_order(order)
-        else:
-            for index, target in enumerate(order['targets']):
-                if target['order_id'] not in remote_order_ids and target['status'] == 'placed':
-                    try:
-
-                        position = client.get_position_risk(symbol=order['symbol'] + 'USDT')
-                        new_amt = float(position[0]['positionAmt'])
-
-                        new_stop_price = order['open_position_order']['open_price'] if index == 0 else order['targets'][index - 1]['target_price']
-                        modify_stop_loss_order(
-                            client=client,
-                            symbol=order['symbol'],
-                            side=order['open_position_order']['side'],
-                            order=order,
-                            new_stop_price=new_stop_price,
-                            quantity=new_amt,
-                        )
-                        order_db.update_target_status(order['open_position_order']['order_id'], index, 'filled')
-
-                    except Exception as e:
-                        logger.error(f"Error in handle_filled_targets for order {order['symbol']}: {e}")
-
-
-def handle_entered_positions(client, open_position_orders, remote_order_ids):
-    orders_db = OrderDB()
-    missing_orders = []
-    for order in open_position_orders:
-        if order['open_position_order']['order_id'] not in remote_order_ids:
-            missing_orders.append(order)
 
-    for order_data in missing_orders:
-        if order_data['open_position_order']['status'] != 'filled':
-            try:
-                order_id = order_data['open_position_order']['order_id']
-                orders_db.modify_order_status(symbol=order_data['symbol'], order_id=int(order_id),
-                                              order_type='open_position_order', new_status='filled')
+@timed('handle_filled_targets')
+def handle_filled_targets(client, filled_targets, positions):
+    order_db = OrderDB()
 
-                stop_loss_order = place_stop_loss_order(
+    for order, index in filled_targets:
+        try:
+            new_amt = positions.position_amount(order['symbol'])
+            if new_amt is None:
+                # Left as placed, the next cycle retries it
+                continue
+
+            new_stop_price = order['open_position_order']['open_price'] if index == 0 else order['targets'][index - 1]['target_price']
+            # Re-read the order, an earlier target of this cycle may have replaced the stop already
+            current_order = order_db.get_order_by_id(order['open_position_order']['order_id'])
+            modify_stop_loss_order(
+                client=client,
+                symbol=order['symbol'],
+                side=order['open_position_order']['side'],
+                order=current_order,
+                new_stop_price=new_stop_price,
+                quantity=new_amt,
+            )
+            order_db.update_target_status(order['open_position_order']['order_id'], index, 'filled')
+
+        except Exception as e:
+            logger.error(f"Error in handle_filled_targets for order {order['symbol']}: {e}")
+
+
+def send_exit_bracket(client, order, positions, confirmed_fills):
+    order_id = order['open_position_order']['order_id']
+    if order_id not in confirmed_fills:
+        # Seen missing from the open orders by polling: filled or cancelled
+        amt = positions.position_amount(order['symbol'])
+        if amt is None:
+            return
+        if amt == 0.0:
+            logger.warning(f"Entry {order_id} for {order['symbol']} left the book without a position, removing it")
+            OrderDB().remove_completed_order(order_id)
+            return
+
+    # Protection goes out first, bookkeeping after
+    stop_loss_order, target_orders = submit_bracket(
+        client,
+        order['symbol'],
+        order['exit_bracket']['stop_loss'],
+        order['exit_bracket']['targets'],
+        order['precision'],
+    )
+    OrderDB().record_exit_bracket(
+        order_id=order_id,
+        stop_loss_id=stop_loss_order['orderId'] if stop_loss_order else None,
+        targets=bracket_targets([target['target_price'] for target in order['targets']], target_orders),
+    )
+    logger.info(f"Exit bracket for {order['symbol']} sent on entry {order_id} fill")
+
+
+@timed('handle_entered_positions')
+def handle_entered_positions(client, entered_orders, positions, confirmed_fills=()):
+    orders_db = OrderDB()
+
+    for order_data in entered_orders:
+        try:
+            if order_data.get('exit_bracket'):
+                send_exit_bracket(client, order_data, positions, confirmed_fills)
+                continue
+
+            order_id = order_data['open_position_order']['order_id']
+            orders_db.modify_order_status(symbol=order_data['symbol'], order_id=int(order_id),
+                                          order_type='open_position_order', new_status='filled')
+
+            stop_loss_order = place_stop_loss_order(
+                client=client,
+                symbol=order_data['symbol'],
+                side=order_data['open_position_order']['side'],
+                quantity=order_data['quantity'],
+                stop_price=order_data['stop_loss']['value']
+            )
+
+            orders_db.modify_stop_loss(
+                order_id=order_data['open_position_order']['order_id'],
+                new_status="placed",
+                new_id=stop_loss_order['orderId'],
+            )
+
+            # Place target orders
+            current_order = orders_db.get_order_by_id(order_id=order_id)
+            amt = positions.position_amount(current_order['symbol'])
+            if amt is None:
+                amt = 0.0
+
+            if amt != 0.0:
+                target_orders = place_target_orders(
                     client=client,
-                    symbol=order_data['symbol'],
-                    side=order_data['open_position_order']['side'],
-                    quantity=order_data['quantity'],
-                    stop_price=order_data['stop_loss']['value']
+                    symbol=current_order['symbol'],
+                    side=current_order['open_position_order']['side'],
+                    targets=[target['target_price'] for target in current_order['targets']],
+                    quantity=current_order['quantity'],
+                    precision=current_order['precision'],
                 )
 
-                orders_db.modify_stop_loss(
+                orders_db.update_targets(
                     order_id=order_data['open_position_order']['order_id'],
-                    new_status="placed",
-                    new_id=stop_loss_order['orderId'],
+                    targets=bracket_targets([target['target_price'] for target in current_order['targets']],
+                                            target_orders),
                 )
 
-                # Place target orders
-                current_order = orders_db.get_order_by_id(order_id=order_id)
-                position = None
-                try:
-                    position = client.get_position_risk(symbol=current_order['symbol'] + 'USDT')
-                except Exception as e:
-                    print(f"An error occurred while getting position risk: {e}")
-
-                if position is not None:
-                    amt = float(position[0]['positionAmt'])
-                else:
-                    amt = 0.0
-
-                if amt != 0.0:
-                    target_orders = place_target_orders(
-                        client=client,
-                        symbol=current_order['symbol'],
-                        side=current_order['open_position_order']['side'],
-                        targets=[target['target_price'] for target in current_order['targets']],
-                        quantity=current_order['quantity'],
-                        precision=current_order['precision'],
-                    )
-
-                    orders_db.update_targets(
-                        order_id=order_data['open_position_order']['order_id'],
-                        new_status='placed',
-                        new_target_ids=[order['orderId'] for order in target_orders]
-                    )
-
-            except Exception as e:
-                logger.error(f"Error in handle_entered_positions for order {order_data['symbol']}: {e}")
+        except Exception as e:
+            logger.error(f"Error in handle_entered_positions for order {order_data['symbol']}: {e}")
@@ -1,27 +1,68 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import config
 
-# Configure logging (adjust based on your needs)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
-)
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
 
-# Define handlers for logging to file
-file_handler = logging.FileHandler('cove_bot.log')
-file_handler.setLevel(logging.INFO)  # Set the desired level for file logging
 
-# Add the handlers to the root logger
-logging.getLogger().addHandler(file_handler)
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log shippers.
 
-# Define custom loggers for different parts of your application
-app_logger = logging.getLogger('app')
-app_logger.addHandler(file_handler)  # Add file handler to app logger
+    Tracebacks are already part of the message: QueueHandler folds them in
+    before the record is queued.
+    """
 
-db_logger = logging.getLogger('db')
-db_logger.addHandler(file_handler)  # Add file handler to db logger
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
 
-handler_logger = logging.getLogger('handler')
-handler_logger.addHandler(file_handler)  # Add file handler to handler logger
 
-connector_logger = logging.getLogger('connector')
-connector_logger.addHandler(file_handler)  # Add file handler to connector logger
+def build_file_handler():
+    if config.LOG_ROTATION == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            config.LOG_PATH, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(
+        config.LOG_PATH, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+
+
+def configure_logging():
+    """
+    Route every record through a queue to a single writer thread.
+
+    Loggers only enqueue, so neither the event loop nor the exchange workers
+    ever wait on the console or the disk. The root logger is the only one with
+    a handler: named loggers propagate to it, so each record is written once.
+
+    :return: The running QueueListener.
+    """
+    formatter = JsonFormatter() if config.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    console_handler = logging.StreamHandler()
+    file_handler = build_file_handler()
+    for handler in (console_handler, file_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(config.LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+    listener.start()
+    # Flush what is still queued on exit
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = configure_logging()
@@ -3,60 +3,123 @@ from tenacity import retry, wait_exponential
 import config
 from binance.um_futures import UMFutures as Client
 from telethon import TelegramClient, events
-from handler import handle_message, check_for_updates
+from handler import handle_message, handle_order_trade_update, handle_account_update
+from order_poller import AdaptivePoller
+from symbol_registry import SymbolRegistry
+from seen_messages import SeenMessages
+from account_config import AccountConfigCache
+from account_ledger import AccountLedger
+from user_stream import UserDataStream
+from request_scheduler import RequestScheduler
+from orders_database import OrderDB
+import metrics
+from exchange_executor import run_blocking, run_exclusive, shutdown as shutdown_executor
 from logging_config import logging
-from requests import get
 
 logger = logging.getLogger(__name__)
 
 tg_client = TelegramClient(
     'covebot', int(config.API_ID), config.API_HASH,
 )
-client = Client(
+# Every REST call goes through the scheduler, which reads the usage headers
+client = RequestScheduler(Client(
     key=config.BINANCE_API_KEY,
     secret=config.BINANCE_API_SECRET,
-)
+    base_url=config.BINANCE_BASE_URL,
+    show_limit_usage=True,
+))
+poll_wakeup = asyncio.Event()
 
 
 @retry(wait=wait_exponential(multiplier=1, min=2, max=10))
 async def get_balance():
-    # Check internet connectivity before API call
-    if not get("https://google.com").ok:
-        raise ConnectionError("No internet connection")
-    return client.balance()
+    # The balance request doubles as the connectivity check and re-seeds the sizing ledger
+    return await run_blocking(AccountLedger().refresh, client)
+
+
+async def on_order_update(client, order_update):
+    await run_exclusive(handle_order_trade_update, client, order_update)
+
+
+async def on_account_update(client, account_update):
+    await run_exclusive(handle_account_update, client, account_update)
 
 
 @tg_client.on(events.NewMessage(chats=int(config.CHANNEL_USERNAME)))
 async def my_event_handler(event):
-    print(event.message)
+    # Redelivered messages are dropped before any parsing or API call
+    seen_messages = SeenMessages()
+    message_key = (event.chat_id, event.message.id, event.message.text)
+    if not await run_blocking(seen_messages.mark_seen, *message_key):
+        logger.info(f"Message {event.message.id} already handled, skipping")
+        return
+    logger.info(f"New message {event.message.id} from {event.chat_id}")
     try:
         await handle_message(client, event)
+        # A new position ends any idle backoff of the poller
+        poll_wakeup.set()
     except Exception as e:
-        print(f"Error in handle_message: {e}")
+        logger.error(f"Error in handle_message: {e}")
+        # Left unmarked, a redelivery of the message is retried
+        await run_blocking(seen_messages.forget, *message_key)
 
 
-async def binance_loop():
+async def binance_loop(user_stream):
+    poller = AdaptivePoller(client)
     while True:
         try:
-            balance = await get_balance()
-            print(balance)
-            orders = client.get_orders()
-            check_for_updates(client=client, remote_active_orders=orders)
-            print(orders)
+            await get_balance()
+            # Open orders are fetched inside the exclusive section so a position opened
+            # meanwhile can't be mistaken for filled legs
+            orders = await run_exclusive(poller.poll)
+            if orders is not None:
+                logger.info(f"Polled {len(orders)} open orders")
         except ConnectionError as e:
             logger.error(f"Connection error: {e}")
-        await asyncio.sleep(10)
+        # Polling is only a safety net while fills arrive from the user data stream
+        try:
+            await asyncio.wait_for(poll_wakeup.wait(), timeout=poller.next_interval(user_stream.is_alive()))
+        except asyncio.TimeoutError:
+            pass
+        poll_wakeup.clear()
 
 
 async def main():
+    SymbolRegistry().start(client=client, ttl=config.EXCHANGE_INFO_TTL)
+    AccountConfigCache().warm(client)
     await tg_client.start(config.PHONE_NUMBER)
+
+    user_stream = UserDataStream(client=client, loop=asyncio.get_running_loop(), stream_url=config.BINANCE_STREAM_URL)
+    try:
+        await run_blocking(user_stream.start)
+    except Exception as e:
+        logger.error(f"Error starting user data stream, polling every {config.RECONCILE_FALLBACK_INTERVAL}s: {e}")
+    background_tasks = [
+        asyncio.create_task(user_stream.consume(on_order_update, on_account_update)),
+        asyncio.create_task(user_stream.keepalive(config.LISTEN_KEY_KEEPALIVE)),
+    ]
+
+    if config.METRICS_PORT:
+        try:
+            metrics.start_server(config.METRICS_PORT, config.METRICS_HOST)
+        except OSError as e:
+            logger.error(f"Error starting metrics server on port {config.METRICS_PORT}, running without metrics: {e}")
+        else:
+            metrics.ACTIVE_ORDERS.set_function(OrderDB().count_active_orders)
+            background_tasks.append(
+                asyncio.create_task(metrics.monitor_event_loop_lag(config.EVENT_LOOP_LAG_INTERVAL)))
+
     # Launch binance_loop as a separate task
-    binance_task = asyncio.create_task(binance_loop())
+    binance_task = asyncio.create_task(binance_loop(user_stream))
     try:
         # Run Telegram client until disconnected
         await tg_client.run_until_disconnected()
     finally:
+        for task in background_tasks:
+            task.cancel()
+        user_stream.stop()
         await binance_task
+        shutdown_executor()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,74 @@
+from orders_database import OrderDB
+from handler import check_for_updates
+from logging_config import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+# Weight of get_orders() without a symbol, per-symbol queries cost 1 each
+ALL_ORDERS_WEIGHT = 40
+
+
+class AdaptivePoller:
+    """
+    Safety-net poll of the open orders the bot tracks.
+
+    Only symbols with local active orders are queried, one get_orders(symbol)
+    each, unless that would weigh more than the unfiltered call. With nothing
+    tracked no request is sent at all. The interval stays at the base cadence
+    while entries or targets are waiting on the book and backs off
+    exponentially up to RECONCILE_IDLE_INTERVAL otherwise.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.idle_rounds = 0
+        self.has_pending = False
+
+    def fetch_remote_orders(self, symbols):
+        if len(symbols) >= ALL_ORDERS_WEIGHT:
+            return self.client.get_orders()
+
+        remote_orders = []
+        for symbol in symbols:
+            remote_orders.extend(self.client.get_orders(symbol=symbol + 'USDT'))
+        return remote_orders
+
+    def poll(self):
+        """
+        Reconcile the local orders against the exchange once.
+
+        :return: The remote open orders fetched, None if nothing was polled.
+        """
+        local_orders = OrderDB().get_active_orders()
+        self.has_pending = any(
+            order['open_position_order']['status'] == 'placed'
+            or any(target['status'] == 'placed' for target in order['targets'])
+            for order in local_orders
+        )
+        if not local_orders:
+            return None
+
+        symbols = sorted({order['symbol'] for order in local_orders})
+        try:
+            remote_orders = self.fetch_remote_orders(symbols)
+        except Exception as e:
+            # A partial view would make every order of the missing symbols look filled
+            logger.error(f"Error polling open orders, skipping this cycle: {e}")
+            return None
+
+        check_for_updates(client=self.client, remote_active_orders=remote_orders, local_active_orders=local_orders)
+        return remote_orders
+
+    def next_interval(self, stream_alive):
+        """
+        :param stream_alive: Whether fills currently arrive from the user data stream.
+        :return: Seconds to wait before the next poll.
+        """
+        base = config.RECONCILE_POLL_INTERVAL if stream_alive else config.RECONCILE_FALLBACK_INTERVAL
+        if self.has_pending:
+            self.idle_rounds = 0
+            return base
+
+        self.idle_rounds += 1
+        return min(base * 2 ** self.idle_rounds, config.RECONCILE_IDLE_INTERVAL)
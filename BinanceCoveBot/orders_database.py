@@ -1,6 +1,22 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from tinydb import TinyDB, Query
 from logging_config import logging
+from signal_index import SignalIndex
+import config
+
+
+def order_leg_ids(order):
+    """
+    :return: The exchange order IDs of the entry, stop-loss and targets of an order.
+    """
+    leg_ids = {order['open_position_order']['order_id'], order['stop_loss']['order_id']}
+    leg_ids.update(target['order_id'] for target in order['targets'])
+    leg_ids.discard(None)
+    return leg_ids
 
 
 class OrderDB:
@@ -37,14 +53,187 @@ class OrderDB:
                 "timestamp": str,
                 "precision": int,
                 "quantity": float,
+                "exit_bracket": dict,
             }
-            # Initialize TinyDB database
-            cls._instance.db = TinyDB('active_orders.json')
+            # Initialize SQLite database in WAL mode, every position is one JSON document
+            # and order_legs indexes the entry, stop-loss and target IDs it owns. Binance order
+            # IDs are only unique per symbol, so legs are keyed by both
+            cls._instance.lock = threading.RLock()
+            cls._instance.local = threading.local()
+            cls._instance.db = sqlite3.connect(config.ORDERS_DB_PATH, check_same_thread=False)
+            cls._instance.db.execute("PRAGMA journal_mode=WAL")
+            cls._instance.db.execute("PRAGMA synchronous=FULL")
+            cls._instance.db.executescript('''
+                CREATE TABLE IF NOT EXISTS orders (
+                    position_id INTEGER PRIMARY KEY,
+                    symbol TEXT NOT NULL,
+                    stop_loss_id INTEGER,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS orders_symbol ON orders (symbol);
+                CREATE INDEX IF NOT EXISTS orders_stop_loss_id ON orders (stop_loss_id);
+            ''')
+            cls._instance.create_leg_index()
+            cls._instance.logger = logging.getLogger('handler')
+            # Mirrors the committed orders, kept in step by _write and _delete
+            cls._instance.signal_index = SignalIndex()
+            for (data,) in cls._instance.db.execute("SELECT data FROM orders"):
+                cls._instance.signal_index.add(json.loads(data))
+            cls._instance.migrate_json_store(config.LEGACY_ORDERS_JSON_PATH)
         return cls._instance
 
+    def create_leg_index(self):
+        """
+        Create order_legs, rebuilding it from the orders if it was keyed by leg ID alone.
+        """
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(order_legs)")]
+        if columns and 'symbol' in columns:
+            return
+
+        with self.lock, self.db:
+            self.db.executescript('''
+                DROP TABLE IF EXISTS order_legs;
+                CREATE TABLE order_legs (
+                    symbol TEXT NOT NULL,
+                    leg_id INTEGER NOT NULL,
+                    position_id INTEGER NOT NULL,
+                    PRIMARY KEY (symbol, leg_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX order_legs_position_id ON order_legs (position_id);
+            ''')
+            for (data,) in self.db.execute("SELECT data FROM orders").fetchall():
+                self._write_legs(json.loads(data))
+
+    def migrate_json_store(self, json_path):
+        """
+        One-shot import of the orders kept by the former TinyDB store.
+
+        The JSON file is renamed once its orders are imported, so the migration never runs twice.
+        """
+        if not os.path.exists(json_path):
+            return
+
+        with open(json_path, "r") as json_file:
+            content = json_file.read()
+        tables = json.loads(content) if content.strip() else {}
+        orders = list(tables.get("_default", {}).values())
+
+        with self.lock, self.db:
+            for order in orders:
+                self._write(order)
+        os.replace(json_path, json_path + ".migrated")
+        self.logger.info("Migrated %s orders from %s", len(orders), json_path)
+
+    def _write(self, order):
+        position_id = order['open_position_order']['order_id']
+        self.db.execute(
+            "INSERT OR REPLACE INTO orders (position_id, symbol, stop_loss_id, data) VALUES (?, ?, ?, ?)",
+            (position_id, order['symbol'], order['stop_loss']['order_id'], json.dumps(order)),
+        )
+        self._write_legs(order)
+        self.signal_index.add(order)
+
+    def _write_legs(self, order):
+        position_id = order['open_position_order']['order_id']
+        self.db.execute("DELETE FROM order_legs WHERE position_id = ?", (position_id,))
+        self.db.executemany(
+            "INSERT OR REPLACE INTO order_legs (symbol, leg_id, position_id) VALUES (?, ?, ?)",
+            [(order['symbol'], leg_id, position_id) for leg_id in order_leg_ids(order)],
+        )
+
+    def _delete(self, position_id):
+        self.db.execute("DELETE FROM orders WHERE position_id = ?", (position_id,))
+        self.db.execute("DELETE FROM order_legs WHERE position_id = ?", (position_id,))
+        self.signal_index.discard(position_id)
+
+    def _pending(self):
+        return getattr(self.local, 'pending', None)
+
+    def _reads(self):
+        return getattr(self.local, 'reads', None)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work for one reconcile cycle.
+
+        Mutations made by this thread inside the block are buffered in memory and
+        reads are served from that buffer, then everything is written in a single
+        SQLite transaction (one fsync) when the block exits. Orders that were only
+        read are cached apart and never written back. Nested blocks join the outer
+        one.
+        """
+        if self._pending() is not None:
+            yield self
+            return
+
+        self.local.pending = {}
+        self.local.reads = {}
+        try:
+            yield self
+        finally:
+            # Flush even if the cycle failed: buffered changes mirror orders already sent to the exchange
+            pending, self.local.pending, self.local.reads = self.local.pending, None, None
+            if pending:
+                with self.lock, self.db:
+                    for position_id, order in pending.items():
+                        if order is None:
+                            self._delete(position_id)
+                        else:
+                            self._write(order)
+
+    def _save(self, order):
+        pending = self._pending()
+        if pending is not None:
+            pending[order['open_position_order']['order_id']] = order
+        else:
+            with self.lock, self.db:
+                self._write(order)
+
+    def _load(self, position_id):
+        pending = self._pending()
+        if pending is not None and position_id in pending:
+            return pending[position_id]
+        reads = self._reads()
+        if reads is not None and position_id in reads:
+            return reads[position_id]
+        with self.lock:
+            row = self.db.execute("SELECT data FROM orders WHERE position_id = ?", (position_id,)).fetchone()
+        order = json.loads(row[0]) if row else None
+        if order is not None and reads is not None:
+            # Later reads in this unit of work get the same copy, only _save queues it for writing
+            reads[position_id] = order
+        return order
+
+    def _load_by_leg(self, symbol, leg_id):
+        pending = self._pending() or {}
+        for order in pending.values():
+            if order is not None and order['symbol'] == symbol and leg_id in order_leg_ids(order):
+                return order
+        with self.lock:
+            row = self.db.execute("SELECT position_id FROM order_legs WHERE symbol = ? AND leg_id = ?",
+                                  (symbol, leg_id)).fetchone()
+        if row is None or (row[0] in pending and pending[row[0]] is None):
+            return None
+        return self._load(row[0])
+
+    def _select(self, sql, params=()):
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        reads = self._reads() or {}
+        orders = {position_id: reads[position_id] if position_id in reads else json.loads(data)
+                  for position_id, data in rows}
+
+        pending = self._pending()
+        if pending:
+            for position_id, order in pending.items():
+                if position_id in orders or order is not None:
+                    orders[position_id] = order
+        return [order for order in orders.values() if order is not None]
+
     def store_active_order(self, symbol, open_position_order_status, open_position_order_id, open_position_side,
                            targets, stop_loss_value, precision, quantity, stop_loss_status="pending", stop_loss_id=None,
-                           open_price=0.0):
+                           open_price=0.0, exit_bracket=None):
 
         # Data validation (add validation for symbol and side)
         if not isinstance(symbol, str):
@@ -89,22 +278,45 @@ class OrderDB:
                 "precision": precision,
                 "quantity": quantity,
             }
+            if exit_bracket is not None:
+                # Stop-loss and target payloads to send as soon as the entry fills
+                new_order["exit_bracket"] = exit_bracket
 
             # Insert the new order into the database
-            self.db.insert(new_order)
+            self._save(new_order)
         except Exception as e:
             # Handle database insertion error (log it, notify admin, etc.)
-            print(f"Error storing order: {e}")
+            self.logger.error(f"Error storing order: {e}")
 
     def remove_completed_order(self, position_id):
-        query = Query().open_position_order.order_id == position_id
-        self.db.remove(query)
+        pending = self._pending()
+        if pending is not None:
+            pending[position_id] = None
+        else:
+            with self.lock, self.db:
+                self._delete(position_id)
 
     def get_active_orders(self):
-        return self.db.all()
+        return self._select("SELECT position_id, data FROM orders")
+
+    def count_active_orders(self):
+        # Committed positions only, safe to call from any thread
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def get_orders_by_symbol(self, symbol):
+        return [order for order in self._select("SELECT position_id, data FROM orders WHERE symbol = ?", (symbol,))
+                if order['symbol'] == symbol]
 
     def clear_active_orders(self):
-        self.db.truncate()
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM orders")
+            self.db.execute("DELETE FROM order_legs")
+            self.signal_index.clear()
+        pending = self._pending()
+        if pending is not None:
+            pending.clear()
+            self._reads().clear()
 
     def modify_order_status(self, symbol, order_type, order_id, new_status):
         """
@@ -123,20 +335,36 @@ class OrderDB:
         if order_type not in ['open_position_order', 'target', 'stop_loss']:
             raise ValueError("Invalid order_type. Must be 'open_position_order', 'target', or 'stop_loss'.")
 
-        # Find the order in the database
-        query = Query()
-        order = self.db.get((query.symbol == symbol) & (query[order_type].order_id == order_id))
-        if order:
-            try:
-                # Update the status
-                order[order_type]['status'] = new_status
-                # Update the order in the database
-                self.db.update(order, (query.symbol == symbol) & (query[order_type].order_id == order_id))
-            except Exception as e:
-                # Handle database update error (log it, notify admin, etc.)
-                print(f"Error modifying order status: {e}")
-        else:
-            print(f"Order with symbol '{symbol}' and ID '{order_id}' not found.")
+        with self.lock:
+            # Find the order in the database
+            order = self._load_by_leg(symbol, order_id)
+            if order:
+                try:
+                    # Update the status
+                    if order_type == 'target':
+                        for target in order['targets']:
+                            if target['order_id'] == order_id:
+                                target['status'] = new_status
+                    elif order[order_type]['order_id'] == order_id:
+                        order[order_type]['status'] = new_status
+                    # Update the order in the database
+                    self._save(order)
+                except Exception as e:
+                    # Handle database update error (log it, notify admin, etc.)
+                    self.logger.error(f"Error modifying order status: {e}")
+            else:
+                self.logger.warning(f"Order with symbol '{symbol}' and ID '{order_id}' not found.")
+
+    def find_signal_duplicate(self, signal):
+        """
+        Find an active order opened from the same signal.
+
+        :param signal: Parsed Signal.
+        :return: A dictionary representing the order data if found, None otherwise.
+        """
+        with self.lock:
+            position_id = self.signal_index.find(signal)
+        return self._load(position_id) if position_id is not None else None
 
     def get_order_by_id(self, order_id):
         """
@@ -148,7 +376,34 @@ class OrderDB:
         if not isinstance(order_id, int):
             raise ValueError("order_id must be an integer")
 
-        return self.db.get(lambda doc: doc["open_position_order"]["order_id"] == order_id)
+        return self._load(order_id)
+
+    def get_order_by_leg_id(self, symbol, order_id):
+        """
+        Get the order that owns an entry, stop-loss or target order ID.
+
+        :param symbol: The symbol of the order, e.g. 'BTC'.
+        :param order_id: The exchange order ID of any leg of the order.
+        :return: A dictionary representing the order data if found, None otherwise.
+        """
+        return self._load_by_leg(symbol, order_id)
+
+    def update_target_status(self, order_id, target_index, new_status):
+        """
+        Set the status of one target of an order.
+
+        Args:
+        order_id (int): The ID of the open position order.
+        target_index (int): The index of the target in the order's targets.
+        new_status (str): The new status to set for the target.
+        """
+        with self.lock:
+            order = self._load(order_id)
+            if order:
+                order['targets'][target_index]['status'] = new_status
+                self._save(order)
+            else:
+                self.logger.warning("Order ID not found: %s", order_id)
 
     def modify_stop_loss(self, order_id, new_status, new_id=None, new_value=None):
         """
@@ -166,43 +421,68 @@ class OrderDB:
         if not isinstance(order_id, int):
             raise ValueError("order_id must be an integer")
 
-        # Find the order in the database
-        query = Query()
-        order = self.db.get((query.stop_loss.order_id == order_id))
-        if order:
-            try:
-                # Update the stop loss status
-                order['stop_loss']['status'] = new_status
-                # If new_value is provided, update the stop loss value
-                if new_value is not None:
-                    order['stop_loss']['value'] = new_value
-                if new_id is not None:
-                    order['stop_loss']['order_id'] = new_id
-                # Update the order in the database
-                self.db.update(order, (query.open_position_order.order_id == order_id))
-            except Exception as e:
-                # Handle database update error (log it, notify admin, etc.)
-                print(f"Error modifying stop loss: {e}")
-        else:
-            print(f"Stop loss with order ID '{order_id}' not found.")
+        with self.lock:
+            # Find the order in the database
+            order = self._load(order_id)
+            if order:
+                try:
+                    # Update the stop loss status
+                    order['stop_loss']['status'] = new_status
+                    # If new_value is provided, update the stop loss value
+                    if new_value is not None:
+                        order['stop_loss']['value'] = new_value
+                    if new_id is not None:
+                        order['stop_loss']['order_id'] = new_id
+                    # Update the order in the database
+                    self._save(order)
+                except Exception as e:
+                    # Handle database update error (log it, notify admin, etc.)
+                    self.logger.error(f"Error modifying stop loss: {e}")
+            else:
+                self.logger.warning(f"Stop loss with order ID '{order_id}' not found.")
+
+    def record_exit_bracket(self, order_id, stop_loss_id, targets):
+        """
+        Record the result of the exit bracket sent when a deferred entry filled.
 
-    def update_targets(self, order_id, new_status, new_target_ids=None):
-        order = Query()
-        order_entry = self.db.get(order.open_position_order.order_id == order_id)
+        Args:
+        order_id (int): The ID of the open position order.
+        stop_loss_id (int): The ID of the placed stop-loss, None if it failed.
+        targets (list): The stored targets, see connector.bracket_targets.
+        """
+        with self.lock:
+            order = self._load(order_id)
+            if order:
+                order['open_position_order']['status'] = 'filled'
+                order['stop_loss']['order_id'] = stop_loss_id
+                order['stop_loss']['status'] = 'placed' if stop_loss_id is not None else 'pending'
+                order['targets'] = targets
+                order.pop('exit_bracket', None)
+                self._save(order)
+            else:
+                self.logger.warning("Order ID not found: %s", order_id)
 
-        if order_entry:
-            # Update status of open_position_order
-            order_entry['open_position_order']['status'] = new_status
+    def update_targets(self, order_id, new_status=None, targets=None):
+        """
+        Args:
+        order_id (int): The ID of the open position order.
+        new_status (str): Status to set on every stored target, if `targets` is not given.
+        targets (list): Targets replacing the stored ones, see connector.bracket_targets.
+        """
+        with self.lock:
+            order_entry = self._load(order_id)
 
-            # Update target_ids if provided
-            if new_target_ids:
-                order_entry['targets'] = [{'order_id': tid, 'status': 'pending', 'target_price': None} for tid in
-                                          new_target_ids]
+            if order_entry:
+                if targets is not None:
+                    order_entry['targets'] = targets
+                else:
+                    for target in order_entry['targets']:
+                        target['status'] = new_status
 
-            # Update the entry in the database
-            self.db.update(order_entry, order.open_position_order.order_id == order_id)
-            self.logger.info("Targets updated successfully. Order ID: %s", order_id)
-            return True
-        else:
-            self.logger.warning("Order ID not found: %s", order_id)
-            return False
+                # Update the entry in the database
+                self._save(order_entry)
+                self.logger.info("Targets updated successfully. Order ID: %s", order_id)
+                return True
+            else:
+                self.logger.warning("Order ID not found: %s", order_id)
+                return False
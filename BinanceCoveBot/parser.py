@@ -1,3 +1,5 @@
+import hashlib
+import os
 import re
 import yaml
 from cove_signal import Signal
@@ -6,6 +8,9 @@ import config as cfg
 
 logger = logging.getLogger(__name__)
 
+NUMBER_REGEX = re.compile(r'\d+\.\d+|\d+')
+INTEGER_REGEX = re.compile(r'\d+')
+
 
 def compile_regex(config, category):
     try:
@@ -19,7 +24,7 @@ def compile_regex(config, category):
 
 def extract_numbers(string):
     # Use regex to find all the numbers in the input string
-    numbers = re.findall(r'\d+\.\d+|\d+', string)
+    numbers = NUMBER_REGEX.findall(string)
 
     # Check if there are any numbers found
     if not numbers:
@@ -35,64 +40,221 @@ def extract_numbers(string):
     return numbers
 
 
-def parse_message(message):
-    logging.info("Parsing message...")
+def resolve_leverage(leverage):
+    # Handle leverage and max leverage
+    leverage_numbers = INTEGER_REGEX.findall(leverage) if leverage else None
+    leverage_numbers = [int(num) for num in leverage_numbers] if leverage_numbers else None
+    max_leverage = max(leverage_numbers) if leverage_numbers else None
+    if max_leverage is None:
+        return cfg.MIN_LEVERAGE
+    if max_leverage < cfg.MIN_LEVERAGE:
+        max_leverage = cfg.MIN_LEVERAGE
+    return max_leverage if max_leverage and max_leverage <= cfg.MAX_LEVERAGE else cfg.MAX_LEVERAGE
 
-    # Load data from yaml file
-    try:
-        with open("config.yaml", "r") as yaml_file:
-            config = yaml.safe_load(yaml_file)
-    except FileNotFoundError as e:
-        logging.error(f"Error opening config file: {e}")
-        return None
 
-    # Compile regular expressions for each category
-    order_type_regex = compile_regex(config, "order_type")
-    between_regex = compile_regex(config, "between")
-    targets_regex = compile_regex(config, "targets")
-    stop_loss_regex = compile_regex(config, "stop_loss")
-    leverage_regex = compile_regex(config, "leverage")
-    currency_name_regex = re.compile(config["regex"]["currency_name"], re.IGNORECASE)
-
-    # Use compiled regular expressions
-    order_type_match = order_type_regex.search(message)
-    order_type = order_type_match.group() if order_type_match else None
+def build_signal(order_type, between, targets, stop_loss, leverage, currency_name):
     order_type = 'SELL' if order_type and 'sell' in order_type.lower() else 'BUY'
 
-    between_match = between_regex.search(message)
-    between = extract_numbers(between_match.group()) if between_match else None
-
-    targets_match = targets_regex.search(message)
-    targets = extract_numbers(targets_match.group()) if targets_match else None
-
     if targets:
         targets = targets[:cfg.TARGETS_IN_USE]
 
-    stop_loss_match = stop_loss_regex.search(message)
-    stop_loss = float(extract_numbers(stop_loss_match.group())[0]) if stop_loss_match else None
-
-    leverage_match = leverage_regex.search(message)
-    leverage = leverage_match.group() if leverage_match else None
-
-    currency_name_match = currency_name_regex.search(message)
-    currency_name = currency_name_match.group() if currency_name_match else None
-
-    # Handle leverage and max leverage
-    leverage_numbers = re.findall(r'\d+', leverage) if leverage else None
-    leverage_numbers = [int(num) for num in leverage_numbers] if leverage_numbers else None
-    max_leverage = max(leverage_numbers) if leverage_numbers else None
-    if max_leverage is None:
-        result_leverage = cfg.MIN_LEVERAGE
-    else:
-        if max_leverage < cfg.MIN_LEVERAGE:
-            max_leverage = cfg.MIN_LEVERAGE
-        result_leverage = max_leverage if max_leverage and max_leverage <= cfg.MAX_LEVERAGE else cfg.MAX_LEVERAGE
-
     return Signal(
         order_type=order_type,
         between=between,
         targets=targets,
         stop_loss=stop_loss,
-        leverage=result_leverage,
+        leverage=resolve_leverage(leverage),
         currency_name=currency_name
     )
+
+
+class SignalExtractor:
+    """
+    Single-pass extractor for every Signal field.
+
+    The message is scanned once by a master pattern that reports every position
+    where a keyword starts, overlapping ones included. Each category regex from
+    config.yaml is then only anchored at those positions, in order, so every
+    field gets exactly the match its own search() would have found without
+    rescanning the whole message per category.
+    """
+
+    KEYWORD_CATEGORIES = ("order_type", "between", "targets", "stop_loss", "leverage")
+
+    def __init__(self, config):
+        self.regexes = {category: compile_regex(config, category) for category in self.KEYWORD_CATEGORIES}
+        self.regexes["currency_name"] = re.compile(config["regex"]["currency_name"], re.IGNORECASE)
+
+        keywords = {category: [word.lower() for word in config["keywords"][category]]
+                    for category in self.KEYWORD_CATEGORIES}
+        words = sorted({word for category_words in keywords.values() for word in category_words},
+                       key=len, reverse=True)
+
+        # The master pattern reports the longest keyword starting at a position. Every
+        # shorter keyword starting there is a prefix of it, so the categories that can
+        # match at a hit are known up front.
+        self.categories = {
+            longest: tuple(category for category, category_words in keywords.items()
+                           if any(longest.startswith(word) for word in category_words))
+            for longest in words
+        }
+
+        # One branch per first character, so the scan can skip to candidate positions.
+        # Only that character is consumed, so overlapping hits are still reported.
+        branches = {}
+        for word in words:
+            branches.setdefault(word[0], []).append(re.escape(word[1:]))
+        master_pattern = "|".join(
+            f"{re.escape(first)}(?=({'|'.join(rests)}))" for first, rests in branches.items()
+        )
+        self.master_regex = re.compile(master_pattern)
+        self.master_regex_ignorecase = re.compile(master_pattern, re.IGNORECASE)
+
+    def find_matches(self, message):
+        """
+        Scan the message once and return the leftmost match text of every
+        keyword category found.
+        """
+        lowered = message.lower()
+        if len(lowered) == len(message):
+            hits = self.master_regex.finditer(lowered)
+        else:
+            # Lowercasing changed character offsets, scan the original text instead
+            hits = self.master_regex_ignorecase.finditer(message)
+
+        matches = {}
+        for hit in hits:
+            keyword = (hit.group() + hit.group(hit.lastindex)).lower()
+            for category in self.categories.get(keyword, ()):
+                if category not in matches:
+                    match = self.regexes[category].match(message, hit.start())
+                    if match:
+                        matches[category] = match.group()
+            if len(matches) == len(self.KEYWORD_CATEGORIES):
+                break
+        return matches
+
+    def extract(self, message):
+        matches = self.find_matches(message)
+
+        between = matches.get("between")
+        targets = matches.get("targets")
+        stop_loss = matches.get("stop_loss")
+        stop_loss_numbers = extract_numbers(stop_loss) if stop_loss else None
+
+        currency_name_match = self.regexes["currency_name"].search(message)
+
+        return build_signal(
+            order_type=matches.get("order_type"),
+            between=extract_numbers(between) if between else None,
+            targets=extract_numbers(targets) if targets else None,
+            stop_loss=float(stop_loss_numbers[0]) if stop_loss_numbers else None,
+            leverage=matches.get("leverage"),
+            currency_name=currency_name_match.group() if currency_name_match else None,
+        )
+
+
+class SignalParser:
+    """
+    Long-lived signal parser.
+
+    The keyword/regex config is loaded and compiled once and is only reloaded
+    when the mtime of the config file changes and its content hash differs
+    from the one already compiled.
+    """
+
+    def __init__(self, config_path="config.yaml"):
+        self.config_path = config_path
+        self.extractor = None
+        self._mtime = None
+        self._digest = None
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """
+        Recompile the regexes if the config file changed on disk.
+
+        :return: True if a compiled config is available, False otherwise.
+        """
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+            if mtime == self._mtime:
+                return True
+
+            with open(self.config_path, "rb") as yaml_file:
+                raw = yaml_file.read()
+        except FileNotFoundError as e:
+            logger.error(f"Error opening config file: {e}")
+            return self.extractor is not None
+
+        self._mtime = mtime
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self._digest:
+            return True
+
+        config = yaml.safe_load(raw)
+        self.extractor = SignalExtractor(config)
+        self._digest = digest
+        logger.info(f"Parser config loaded from {self.config_path}")
+        return True
+
+    def parse(self, message):
+        logging.info("Parsing message...")
+
+        if not self.reload_if_changed():
+            return None
+
+        return self.extractor.extract(message)
+
+    def parse_with_regexes(self, message):
+        """
+        Reference path that runs each category regex separately.
+
+        Kept to verify the single-pass extractor against the config regexes.
+        """
+        if not self.reload_if_changed():
+            return None
+
+        regexes = self.extractor.regexes
+
+        order_type_match = regexes["order_type"].search(message)
+        order_type = order_type_match.group() if order_type_match else None
+
+        between_match = regexes["between"].search(message)
+        between = extract_numbers(between_match.group()) if between_match else None
+
+        targets_match = regexes["targets"].search(message)
+        targets = extract_numbers(targets_match.group()) if targets_match else None
+
+        stop_loss_match = regexes["stop_loss"].search(message)
+        stop_loss_numbers = extract_numbers(stop_loss_match.group()) if stop_loss_match else None
+        stop_loss = float(stop_loss_numbers[0]) if stop_loss_numbers else None
+
+        leverage_match = regexes["leverage"].search(message)
+        leverage = leverage_match.group() if leverage_match else None
+
+        currency_name_match = regexes["currency_name"].search(message)
+        currency_name = currency_name_match.group() if currency_name_match else None
+
+        return build_signal(
+            order_type=order_type,
+            between=between,
+            targets=targets,
+            stop_loss=stop_loss,
+            leverage=leverage,
+            currency_name=currency_name,
+        )
+
+
+_parser = None
+
+
+def get_parser():
+    global _parser
+    if _parser is None:
+        _parser = SignalParser()
+    return _parser
+
+
+def parse_message(message):
+    return get_parser().parse(message)
@@ -0,0 +1,46 @@
+from logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PositionsSnapshot:
+    """
+    Position amounts of all symbols, fetched with a single get_position_risk() call.
+
+    Like PriceSnapshot it is taken lazily on the first lookup and lives for one
+    reconcile cycle, so every stop move and target placement of the cycle
+    shares one weighted request.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.amounts = None
+
+    def refresh(self):
+        try:
+            positions = self.client.get_position_risk()
+        except Exception as e:
+            logger.error(f"Error getting positions snapshot: {e}")
+            self.amounts = {}
+            return False
+
+        amounts = {}
+        for position in positions:
+            # setdefault keeps the first entry per symbol, as position[0] did per request
+            amounts.setdefault(position['symbol'], float(position['positionAmt']))
+        self.amounts = amounts
+        return True
+
+    def position_amount(self, symbol):
+        """
+        Get the position amount of a coin from the snapshot.
+
+        :param symbol: The coin name without the quote asset, e.g. 'BTC'.
+        :return: The signed position amount, or None if it could not be loaded.
+        """
+        if self.amounts is None:
+            self.refresh()
+
+        if not self.amounts:
+            return None
+        return self.amounts.get(symbol + 'USDT', 0.0)
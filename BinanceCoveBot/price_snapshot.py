@@ -0,0 +1,43 @@
+from logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSnapshot:
+    """
+    Last prices of all symbols, fetched with a single ticker_price() call.
+
+    The snapshot is taken lazily on the first lookup, so a reconcile cycle that
+    has nothing price-dependent to check costs no request at all, and one that
+    does costs exactly one whatever the number of orders.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.prices = None
+
+    def refresh(self):
+        try:
+            tickers = self.client.ticker_price()
+        except Exception as e:
+            logger.error(f"Error getting price snapshot: {e}")
+            self.prices = {}
+            return False
+
+        self.prices = {ticker['symbol']: float(ticker['price']) for ticker in tickers}
+        return True
+
+    def price_of(self, symbol):
+        """
+        Get the price of a coin from the snapshot.
+
+        :param symbol: The coin name without the quote asset, e.g. 'BTC'.
+        :return: The last price against USDT, or None if it is unknown.
+        """
+        if self.prices is None:
+            self.refresh()
+
+        price = self.prices.get(symbol + 'USDT')
+        if price is None:
+            logger.error(f"No price for symbol {symbol} in snapshot")
+        return price
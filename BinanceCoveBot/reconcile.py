@@ -0,0 +1,79 @@
+from logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ReconcileDiff:
+    """
+    Typed difference between the local order store and the exchange for one cycle.
+    """
+
+    def __init__(self, remote_order_ids):
+        self.remote_order_ids = remote_order_ids
+        self.stops_hit = []
+        self.entries_filled = []
+        self.targets_filled = []  # (order, target index) pairs
+        self.completed = []
+        self.expired = []
+
+    def __str__(self):
+        return (
+            f"ReconcileDiff(stops_hit={len(self.stops_hit)}, entries_filled={len(self.entries_filled)}, "
+            f"targets_filled={len(self.targets_filled)}, completed={len(self.completed)}, "
+            f"expired={len(self.expired)})"
+        )
+
+    def is_empty(self):
+        return not (self.stops_hit or self.entries_filled or self.targets_filled or self.completed or self.expired)
+
+
+def is_expired(order, current_price):
+    # A pending entry expires once price has run past the first target
+    first_target = order['targets'][0]['target_price']
+    if order['open_position_order']['side'] == 'SELL':
+        return current_price < first_target
+    return current_price > first_target
+
+
+def compute_diff(local_active_orders, remote_order_ids, price_of=None):
+    """
+    Compare local orders with the open orders on the exchange in a single pass.
+
+    :param local_active_orders: Orders from OrderDB.
+    :param remote_order_ids: Set of IDs of the orders still open on the exchange.
+    :param price_of: Optional callable returning the current price of a symbol, used
+                     for the expiry check. Expiry is skipped when it is None.
+    :return: ReconcileDiff
+    """
+    diff = ReconcileDiff(remote_order_ids)
+    for order in local_active_orders:
+        entry = order['open_position_order']
+        stop_loss_id = order['stop_loss']['order_id']
+
+        if stop_loss_id is not None and stop_loss_id not in remote_order_ids:
+            # The position is closed, remaining targets are cancelled with it
+            diff.stops_hit.append(order)
+            continue
+
+        if entry['order_id'] not in remote_order_ids:
+            if entry['status'] != 'filled':
+                diff.entries_filled.append(order)
+                continue
+        elif entry['status'] == 'placed':
+            if price_of is not None and order['targets']:
+                current_price = price_of(order['symbol'])
+                if current_price is not None and is_expired(order, current_price):
+                    diff.expired.append(order)
+            continue
+
+        if all(target['status'] == 'filled' for target in order['targets']):
+            diff.completed.append(order)
+            continue
+
+        for index, target in enumerate(order['targets']):
+            if target['status'] == 'placed' and target['order_id'] not in remote_order_ids:
+                diff.targets_filled.append((order, index))
+
+    if not diff.is_empty():
+        logger.info(f"Reconcile: {diff}")
+    return diff
@@ -0,0 +1,181 @@
+import threading
+import time
+from binance.error import ClientError
+from metrics import REST_REQUESTS, REST_WEIGHT, REST_ERRORS
+from logging_config import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower value goes first
+PROTECT = 0  # stop-losses, brackets and cancels
+ENTRY = 1  # entries, targets and their account setup
+POLL = 2  # polling and reference data
+
+LANE_NAMES = {PROTECT: 'protect', ENTRY: 'entry', POLL: 'poll'}
+
+# Share of each budget a lane must leave untouched for the lanes above it
+LANE_FLOORS = {PROTECT: 0.0, ENTRY: 0.1, POLL: 0.4}
+
+PROTECT_METHODS = {'cancel_order', 'cancel_batch_order', 'cancel_open_orders', 'new_batch_order'}
+PROTECT_ORDER_TYPES = {'STOP_MARKET', 'STOP', 'TAKE_PROFIT_MARKET', 'TRAILING_STOP_MARKET'}
+ENTRY_METHODS = {'new_order', 'change_leverage', 'change_margin_type', 'get_open_orders', 'query_order',
+                 'renew_listen_key'}
+
+# Request weights of the USD-M futures endpoints the bot uses, 1 when not listed
+REQUEST_WEIGHTS = {
+    'get_orders': lambda kwargs: 1 if kwargs.get('symbol') else 40,
+    'ticker_price': lambda kwargs: 1 if kwargs.get('symbol') or kwargs.get('args') else 2,
+    'get_position_risk': lambda kwargs: 5,
+    'balance': lambda kwargs: 5,
+    'account': lambda kwargs: 5,
+    'new_batch_order': lambda kwargs: 5,
+    'new_order': lambda kwargs: 0,
+}
+ORDER_METHODS = {
+    'new_order': lambda kwargs: 1,
+    'new_batch_order': lambda kwargs: len(kwargs.get('batchOrders') or ()),
+}
+
+
+def request_lane(name, kwargs):
+    if name in PROTECT_METHODS or name == 'new_order' and kwargs.get('type') in PROTECT_ORDER_TYPES:
+        return PROTECT
+    if name in ENTRY_METHODS:
+        return ENTRY
+    return POLL
+
+
+class RateWindow:
+    """
+    Budget of one Binance rate limit.
+
+    Binance counts usage in fixed windows aligned to the clock (the weight per
+    minute, the order count per 10 seconds), so the budget is the capacity left
+    in the current window and it refills all at once when the next one starts.
+    Usage headers returned by the exchange are authoritative and can only take
+    budget away.
+    """
+
+    def __init__(self, capacity, interval):
+        self.capacity = capacity
+        self.interval = interval
+        self.window = None
+        self.used = 0
+
+    def _roll(self):
+        window = int(time.time() // self.interval)
+        if window != self.window:
+            self.window = window
+            self.used = 0
+
+    def wait_time(self, cost, floor):
+        """
+        :return: Seconds until `cost` can be spent while leaving `floor` of the capacity, 0 if now.
+        """
+        self._roll()
+        if self.used + cost <= self.capacity * (1 - floor):
+            return 0.0
+        return (self.window + 1) * self.interval - time.time()
+
+    def spend(self, cost):
+        self._roll()
+        self.used += cost
+
+    def sync(self, used):
+        self._roll()
+        self.used = max(self.used, used)
+
+    def exhaust(self):
+        self._roll()
+        self.used = self.capacity
+
+
+class RequestScheduler:
+    """
+    Weight-aware front for the UMFutures client.
+
+    Exposes the same methods as the client. Each call is assigned a priority
+    lane and waits until the request weight (and, for orders, the order count)
+    budget allows it. Low lanes must leave a share of the budget to the lanes
+    above them, so polling and reference data are deferred first and protective
+    orders are the last to wait. The wrapped client is expected to be created
+    with show_limit_usage=True: the usage headers resync the budgets after every
+    response, and the data is returned unwrapped.
+    """
+
+    def __init__(self, client, weight_limit=None, order_limit=None, weight_interval=60, order_interval=10):
+        self.client = client
+        self.condition = threading.Condition()
+        self.weight_window = RateWindow(weight_limit or config.REQUEST_WEIGHT_LIMIT, weight_interval)
+        self.order_window = RateWindow(order_limit or config.ORDER_COUNT_LIMIT_10S, order_interval)
+        self.blocked_until = 0.0
+        self.waits = {lane: 0 for lane in LANE_NAMES}
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def scheduled(*args, **kwargs):
+            return self.call(name, attribute, args, kwargs)
+
+        return scheduled
+
+    def _acquire(self, lane, weight, orders):
+        floor = LANE_FLOORS[lane]
+        with self.condition:
+            waited = False
+            while True:
+                delay = max(
+                    self.blocked_until - time.monotonic() if lane != PROTECT else 0.0,
+                    self.weight_window.wait_time(weight, floor),
+                    self.order_window.wait_time(orders, floor) if orders else 0.0,
+                )
+                if delay <= 0:
+                    break
+                waited = True
+                self.condition.wait(delay)
+            if waited:
+                self.waits[lane] += 1
+            self.weight_window.spend(weight)
+            self.order_window.spend(orders)
+
+    def _sync(self, limit_usage):
+        with self.condition:
+            for header, value in limit_usage.items():
+                if header == 'x-mbx-used-weight-1m':
+                    self.weight_window.sync(int(value))
+                elif header == 'x-mbx-order-count-10s':
+                    self.order_window.sync(int(value))
+            self.condition.notify_all()
+
+    def call(self, name, method, args, kwargs):
+        lane = request_lane(name, kwargs)
+        params = dict(kwargs, args=args)
+        weight = REQUEST_WEIGHTS.get(name, lambda _: 1)(params)
+        orders = ORDER_METHODS.get(name, lambda _: 0)(params)
+        self._acquire(lane, weight, orders)
+        REST_REQUESTS.inc(endpoint=name, lane=LANE_NAMES[lane])
+        REST_WEIGHT.inc(weight, endpoint=name)
+
+        try:
+            result = method(*args, **kwargs)
+        except ClientError as e:
+            REST_ERRORS.inc(endpoint=name, status=e.status_code)
+            if e.status_code in (418, 429):
+                retry_after = int((e.header or {}).get('Retry-After', 60))
+                logger.error(f"Rate limited on {name} ({e.status_code}), deferring non-protective calls "
+                             f"for {retry_after}s")
+                with self.condition:
+                    self.weight_window.exhaust()
+                    self.blocked_until = time.monotonic() + retry_after
+            raise
+        except Exception as e:
+            REST_ERRORS.inc(endpoint=name, status=getattr(e, 'status_code', 'error'))
+            raise
+
+        if isinstance(result, dict) and 'limit_usage' in result and 'data' in result:
+            self._sync(result['limit_usage'])
+            return result['data']
+        return result
@@ -0,0 +1,114 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from logging_config import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing over one blake2b digest gives all k positions
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenMessages:
+    """
+    Persistent set of the Telegram messages already handled.
+
+    A message is identified by (chat_id, message_id, content hash), so a
+    redelivered message is skipped before it is parsed while an edited one is
+    handled again. A Bloom filter answers "never seen" without touching disk;
+    only its hits are confirmed against the SQLite table.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SeenMessages, cls).__new__(cls)
+            # Used from the exchange thread pool, one call at a time
+            cls._instance.lock = threading.Lock()
+            cls._instance.db = sqlite3.connect(config.SEEN_MESSAGES_DB_PATH, check_same_thread=False)
+            cls._instance.db.execute("PRAGMA journal_mode=WAL")
+            cls._instance.db.execute('''
+                CREATE TABLE IF NOT EXISTS seen_messages (
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    content_hash BLOB NOT NULL,
+                    seen_at REAL NOT NULL,
+                    PRIMARY KEY (chat_id, message_id, content_hash)
+                ) WITHOUT ROWID
+            ''')
+            cls._instance.load()
+        return cls._instance
+
+    def load(self):
+        cutoff = time.time() - config.SEEN_MESSAGES_RETENTION_DAYS * 24 * 60 * 60
+        with self.db:
+            self.db.execute("DELETE FROM seen_messages WHERE seen_at < ?", (cutoff,))
+
+        self.bloom = BloomFilter(config.SEEN_MESSAGES_CAPACITY, config.SEEN_MESSAGES_ERROR_RATE)
+        count = 0
+        for chat_id, message_id, content_hash in self.db.execute(
+                "SELECT chat_id, message_id, content_hash FROM seen_messages"):
+            self.bloom.add(self._key(chat_id, message_id, content_hash))
+            count += 1
+        logger.info(f"Loaded {count} seen messages")
+
+    @staticmethod
+    def content_hash(text):
+        return hashlib.blake2b((text or '').encode('utf-8'), digest_size=16).digest()
+
+    @staticmethod
+    def _key(chat_id, message_id, content_hash):
+        return f"{chat_id}:{message_id}:".encode() + content_hash
+
+    def mark_seen(self, chat_id, message_id, text):
+        """
+        Record a message as handled.
+
+        :param chat_id: The chat the message was posted in.
+        :param message_id: The Telegram message ID.
+        :param text: The message text.
+        :return: True if the message is new, False if it was already handled.
+        """
+        content_hash = self.content_hash(text)
+        key = self._key(chat_id, message_id, content_hash)
+        with self.lock:
+            if key in self.bloom and self.db.execute(
+                    "SELECT 1 FROM seen_messages WHERE chat_id = ? AND message_id = ? AND content_hash = ?",
+                    (chat_id, message_id, content_hash)).fetchone():
+                return False
+
+            self.bloom.add(key)
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO seen_messages VALUES (?, ?, ?, ?)",
+                                (chat_id, message_id, content_hash, time.time()))
+        return True
+
+    def forget(self, chat_id, message_id, text):
+        """
+        Undo mark_seen for a message whose handling failed, so a redelivery is handled again.
+
+        The Bloom filter keeps the key, its hit falls through to the table.
+        """
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM seen_messages WHERE chat_id = ? AND message_id = ? AND content_hash = ?",
+                            (chat_id, message_id, self.content_hash(text)))
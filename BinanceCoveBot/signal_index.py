@@ -0,0 +1,61 @@
+import bisect
+
+
+class SignalIndex:
+    """
+    In-memory duplicate-signal index over the active orders.
+
+    Orders are bucketed by (symbol, side, stop loss value) and kept sorted by open
+    price inside a bucket, so finding an order matching a signal is a dict lookup
+    plus a bisect on its `between` range. It answers exactly what Signal.compare
+    answers for each stored order.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.entries = {}  # position_id -> (bucket key, open price)
+
+    @staticmethod
+    def _key(symbol, side, stop_loss):
+        return symbol, side, stop_loss
+
+    def add(self, order):
+        position_id = order['open_position_order']['order_id']
+        self.discard(position_id)
+
+        key = self._key(order['symbol'], order['open_position_order']['side'], order['stop_loss']['value'])
+        open_price = order['open_position_order']['open_price']
+        bisect.insort(self.buckets.setdefault(key, []), (open_price, position_id))
+        self.entries[position_id] = (key, open_price)
+
+    def discard(self, position_id):
+        entry = self.entries.pop(position_id, None)
+        if entry is None:
+            return
+
+        key, open_price = entry
+        bucket = self.buckets[key]
+        bucket.remove((open_price, position_id))
+        if not bucket:
+            del self.buckets[key]
+
+    def clear(self):
+        self.buckets.clear()
+        self.entries.clear()
+
+    def find(self, signal):
+        """
+        Find an active order the signal is a copy of.
+
+        :param signal: Parsed Signal.
+        :return: The position ID of the matching order, or None.
+        """
+        bucket = self.buckets.get(self._key(signal.currency_name, signal.order_type, signal.stop_loss))
+        if not bucket:
+            return None
+
+        low, high = min(signal.between), max(signal.between)
+        index = bisect.bisect_left(bucket, (low, float('-inf')))
+        if index < len(bucket) and bucket[index][0] <= high:
+            return bucket[index][1]
+        return None
@@ -0,0 +1,110 @@
+import threading
+import time
+from metrics import stage_timer
+from logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolFilters:
+    def __init__(self, symbol_info):
+        self.symbol = symbol_info['symbol']
+        self.quantity_precision = int(symbol_info['quantityPrecision'])
+        self.price_precision = int(symbol_info['pricePrecision'])
+        self.min_notional = None
+        self.min_qty = None
+        self.max_qty = None
+        self.step_size = None
+        self.min_price = None
+        self.max_price = None
+        self.tick_size = None
+
+        for symbol_filter in symbol_info['filters']:
+            filter_type = symbol_filter['filterType']
+            if filter_type == 'MIN_NOTIONAL':
+                self.min_notional = float(symbol_filter['notional'])
+            elif filter_type == 'LOT_SIZE':
+                self.min_qty = float(symbol_filter['minQty'])
+                self.max_qty = float(symbol_filter['maxQty'])
+                self.step_size = float(symbol_filter['stepSize'])
+            elif filter_type == 'PRICE_FILTER':
+                self.min_price = float(symbol_filter['minPrice'])
+                self.max_price = float(symbol_filter['maxPrice'])
+                self.tick_size = float(symbol_filter['tickSize'])
+
+    def __str__(self):
+        return (f"SymbolFilters(symbol={self.symbol}, quantity_precision={self.quantity_precision}, "
+                f"min_notional={self.min_notional}, step_size={self.step_size}, tick_size={self.tick_size})")
+
+
+class SymbolRegistry:
+    """
+    In-memory index of exchange_info filters by symbol.
+
+    Exchange info is loaded once on start and refreshed by a background thread
+    every `ttl` seconds, so lookups on the signal path never hit the network.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SymbolRegistry, cls).__new__(cls)
+            cls._instance.client = None
+            cls._instance.ttl = None
+            cls._instance.symbols = {}
+            cls._instance.loaded_at = None
+            cls._instance._stop_event = threading.Event()
+            cls._instance._refresh_thread = None
+        return cls._instance
+
+    def start(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self.refresh()
+
+        if self._refresh_thread is None:
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, name='symbol-registry', daemon=True)
+            self._refresh_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def refresh(self):
+        try:
+            with stage_timer('exchange_info'):
+                info = self.client.exchange_info()
+        except Exception as e:
+            logger.error(f"Error refreshing exchange info: {e}")
+            return False
+
+        symbols = {}
+        for symbol_info in info['symbols']:
+            try:
+                symbols[symbol_info['symbol']] = SymbolFilters(symbol_info)
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Skipping symbol {symbol_info.get('symbol')} in exchange info: {e}")
+
+        # Swap the whole index at once so readers never see a partial refresh
+        self.symbols = symbols
+        self.loaded_at = time.monotonic()
+        logger.info(f"Exchange info loaded for {len(symbols)} symbols")
+        return True
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.ttl):
+            self.refresh()
+
+    def get(self, symbol):
+        """
+        Get the filters of a symbol.
+
+        :param symbol: The exchange symbol, e.g. 'BTCUSDT'.
+        :return: SymbolFilters if the symbol is listed, None otherwise.
+        """
+        if self.loaded_at is None and self.client is not None:
+            self.refresh()
+
+        symbol_filters = self.symbols.get(symbol)
+        if symbol_filters is None:
+            logger.error(f"Symbol '{symbol}' not found in exchange information.")
+        return symbol_filters
@@ -0,0 +1,78 @@
+import asyncio
+import json
+from binance.websocket.um_futures.websocket_client import UMFuturesWebsocketClient
+from exchange_executor import run_blocking
+from logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UserDataStream:
+    """
+    Consumer of the Binance futures user data stream.
+
+    Messages arrive on the websocket thread and are handed over to the asyncio
+    loop through a queue. The update callbacks are awaited one event at a time
+    and are expected to serialize themselves with the polling safety net.
+    """
+
+    def __init__(self, client, loop, stream_url):
+        self.client = client
+        self.loop = loop
+        self.stream_url = stream_url
+        self.queue = asyncio.Queue()
+        self.listen_key = None
+        self.ws_client = None
+
+    def start(self):
+        self.listen_key = self.client.new_listen_key()['listenKey']
+        self.ws_client = UMFuturesWebsocketClient(stream_url=self.stream_url, on_message=self._on_message)
+        self.ws_client.user_data(listen_key=self.listen_key)
+        logger.info("User data stream started")
+
+    def stop(self):
+        if self.ws_client is not None:
+            self.ws_client.stop()
+            self.ws_client = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        return self.ws_client is not None and self.ws_client.socket_manager.is_alive()
+
+    def _on_message(self, _, message):
+        # Called from the websocket thread
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    async def keepalive(self, interval):
+        """
+        Renew the listen key periodically and restart the stream if it dropped.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.is_alive():
+                    await run_blocking(self.client.renew_listen_key, self.listen_key)
+                else:
+                    logger.warning("User data stream is down, restarting")
+                    await run_blocking(self.restart)
+            except Exception as e:
+                logger.error(f"Error keeping user data stream alive: {e}")
+
+    async def consume(self, on_order_update, on_account_update):
+        while True:
+            message = await self.queue.get()
+            try:
+                event = json.loads(message)
+                event_type = event.get('e')
+                if event_type == 'ORDER_TRADE_UPDATE':
+                    await on_order_update(self.client, event['o'])
+                elif event_type == 'ACCOUNT_UPDATE':
+                    await on_account_update(self.client, event)
+                elif event_type == 'listenKeyExpired':
+                    logger.warning("Listen key expired, restarting user data stream")
+                    await run_blocking(self.restart)
+            except Exception as e:
+                logger.error(f"Error handling user data event: {e}")
@@ -0,0 +1,99 @@
+"""
+Local stand-in for the Binance user data websocket.
+
+Replays recorded events from a JSONL file (one raw event per line) to every
+client that connects, so the user data stream consumer can be exercised
+without touching Binance. Point the bot at it with
+BINANCE_STREAM_URL=ws://127.0.0.1:8765.
+
+Usage: python ws_replay_server.py recorded_user_events.jsonl [--port 8765] [--delay 0.5]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def text_frame(payload):
+    data = payload.encode("utf-8")
+    if len(data) < 126:
+        header = struct.pack("!BB", 0x81, len(data))
+    elif len(data) < 1 << 16:
+        header = struct.pack("!BBH", 0x81, 126, len(data))
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, len(data))
+    return header + data
+
+
+async def handshake(reader, writer):
+    request = await reader.readuntil(b"\r\n\r\n")
+    headers = {}
+    for line in request.decode("latin-1").split("\r\n")[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest())
+    writer.write(
+        b"HTTP/1.1 101 Switching Protocols\r\n"
+        b"Upgrade: websocket\r\n"
+        b"Connection: Upgrade\r\n"
+        b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+    )
+    await writer.drain()
+
+
+async def drain_client_frames(reader, writer):
+    # Subscriptions and pongs from the client are ignored, a close frame is echoed
+    while True:
+        data = await reader.read(4096)
+        if not data:
+            return
+        if data[0] == 0x88:
+            writer.write(b"\x88\x00")
+            await writer.drain()
+            return
+
+
+def serve(events, delay):
+    async def handle_client(reader, writer):
+        await handshake(reader, writer)
+        drain_task = asyncio.create_task(drain_client_frames(reader, writer))
+        try:
+            for event in events:
+                await asyncio.sleep(delay)
+                writer.write(text_frame(json.dumps(event)))
+                await writer.drain()
+            await drain_task
+        except ConnectionError:
+            pass
+        finally:
+            drain_task.cancel()
+            writer.close()
+
+    return handle_client
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("events", help="JSONL file with one recorded user data event per line")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--delay", type=float, default=0.5, help="seconds between replayed events")
+    args = arg_parser.parse_args()
+
+    with open(args.events, "r") as events_file:
+        events = [json.loads(line) for line in events_file if line.strip()]
+
+    server = await asyncio.start_server(serve(events, args.delay), args.host, args.port)
+    print(f"Replaying {len(events)} events on ws://{args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())